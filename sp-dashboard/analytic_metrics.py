@@ -1,89 +1,14 @@
-from fastapi import FastAPI, HTTPException, Query
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.api_core.exceptions import GoogleAPICallError
-from fastapi.middleware.cors import CORSMiddleware
 import os
+from metrics_engine import create_metrics_app, compute_feedback_averages as compute_shape
 
-app = FastAPI()
+# flat (needs user_type), nested or split; callers can also pass ?shape=
+DEFAULT_SHAPE = os.getenv("METRICS_DEFAULT_SHAPE", "flat")
 
-# Initialize Firebase
-cred = credentials.Certificate(os.getenv("CRED_PATH"))
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+app = create_metrics_app(DEFAULT_SHAPE)
 
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-# Function to calculate averages
-def calculate_averages(feedback_list, keys):
-    total_scores = {key: 0 for key in keys}
-    count = {key: 0 for key in keys}
-
-    for feedback in feedback_list:
-        for key in keys:
-            if key in feedback and feedback[key] is not None:
-                try:
-                    total_scores[key] += float(feedback[key])  # Convert to float for averaging
-                    count[key] += 1
-                except ValueError:
-                    pass  # Skip non-numeric values
-
-    # Compute averages
-    avg_scores = {key: (total_scores[key] / count[key]) if count[key] > 0 else None for key in keys}
-    return avg_scores
-
-
-@app.get("/metrics/")
-async def get_feedback_averages(
-    user_id: str ,
-    user_type: str = Query(..., description="User type: 'customer' or 'sales'")
-):
-    try:
-        feedback_ref = db.collection("feedback")
-
-        # Fetch all feedback for the user_id
-        query = feedback_ref.where("user_id", "==", user_id)
-        results = [doc.to_dict() for doc in query.stream()]
-
-        if not results:
-            raise HTTPException(status_code=404, detail="No feedback found for the given user_id")
-
-        # Define categories based on user type
-        if user_type == "sales":
-            categories = ["sales_and_persuasion", "professionalism_and_presentation"]
-        elif user_type == "customer":
-            categories = ["communication_and_delivery", "customer_interaction_and_resolution"]
-        else:
-            raise HTTPException(status_code=400, detail="Invalid user_type. Must be 'customer' or 'sales'.")
-
-        # Extract relevant feedback data
-        feedback_data = {category: [] for category in categories}
-
-        for feedback_entry in results:
-            for category in categories:
-                if category in feedback_entry:
-                    feedback_data[category].append(feedback_entry[category])
-
-        # Compute averages and flatten into a single dictionary
-        avg_results = {}
-        for category, data_list in feedback_data.items():
-            if data_list:
-                avg_results.update(calculate_averages(data_list, data_list[0].keys()))
-
-        return {"averages": avg_results}
-
-    except GoogleAPICallError as e:
-        raise HTTPException(status_code=500, detail=f"Firestore Error: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+def compute_feedback_averages(user_id: str, user_type: str | None = None):
+    return compute_shape(user_id, DEFAULT_SHAPE, user_type)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+"""Throughput of a service under parallel requests.
+
+Against a running service (start it once with FIRESTORE_OFFLOAD=0 and once
+without to compare blocking calls on the event loop with the Firestore pool):
+
+    python bench_concurrency.py http://localhost:8000/learning_points/ --param user_id=USER_ID -n 500 -c 50
+
+Without a URL, --simulate SECONDS benchmarks an in-process endpoint whose
+"query" is a blocking sleep of that length, inline and offloaded, which needs
+no credentials:
+
+    python bench_concurrency.py --simulate 0.05 -n 400 -c 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+from fastapi import FastAPI
+import firestore_db
+
+
+async def run_benchmark(client: httpx.AsyncClient, url: str, params: dict, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.get(url, params=params)
+                if response.status_code >= 500:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 1),
+        "p50_ms": round(1000 * statistics.median(latencies), 1),
+        "p95_ms": round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 1),
+        "max_ms": round(1000 * latencies[-1], 1),
+    }
+
+
+def simulated_app(latency: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/query/")
+    async def query():
+        await firestore_db.run_db(time.sleep, latency)
+        return {"ok": True}
+
+    return app
+
+
+async def simulate(latency: float, total: int, concurrency: int):
+    transport = httpx.ASGITransport(app=simulated_app(latency))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for offload in (False, True):
+            firestore_db.FIRESTORE_OFFLOAD = offload
+            result = await run_benchmark(client, "/query/", {}, total, concurrency)
+            print(f"{'offloaded' if offload else 'inline':>9}: {result}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Throughput under parallel requests")
+    parser.add_argument("url", nargs="?", help="Endpoint to benchmark")
+    parser.add_argument("--param", action="append", default=[], help="Query parameter as key=value (repeatable)")
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("--simulate", type=float, metavar="SECONDS",
+                        help="Benchmark an in-process endpoint with a blocking call of this length")
+    args = parser.parse_args()
+
+    if args.simulate is not None:
+        await simulate(args.simulate, args.requests, args.concurrency)
+        return
+    if not args.url:
+        parser.error("a URL or --simulate is required")
+
+    params = dict(param.split("=", 1) for param in args.param)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=60.0, limits=limits) as client:
+        print(await run_benchmark(client, args.url, params, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+"""Two-tier cache shared by the worker processes on one host.
+
+L1 is an in-process LRU bounded by serialized size. L2 is a SQLite database
+in WAL mode that every worker (and every service in this directory) can open,
+so a value fetched by one worker is a local read for the others. Values must
+be JSON-serializable.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from cachetools import LRUCache
+
+DEFAULT_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", str(64 * 1024 * 1024)))
+DEFAULT_L2_PATH = os.getenv("CACHE_L2_PATH", "/tmp/scenarioiq_cache.sqlite3")
+DEFAULT_L2_MAX_BYTES = int(os.getenv("CACHE_L2_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Check the L2 size limit every this many writes rather than on each one
+EVICTION_CHECK_INTERVAL = 100
+
+
+class TwoTierCache:
+    def __init__(
+        self,
+        namespace: str,
+        l1_max_bytes: int = DEFAULT_L1_MAX_BYTES,
+        l2_path: str | None = DEFAULT_L2_PATH,
+        l2_max_bytes: int = DEFAULT_L2_MAX_BYTES,
+    ):
+        self.namespace = namespace
+        # L1 stores (value, size) so eviction can count bytes without re-serializing
+        self.l1 = LRUCache(maxsize=l1_max_bytes, getsizeof=lambda item: item[1])
+        self.l2_path = l2_path or None
+        self.l2_max_bytes = l2_max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "l2_evictions": 0, "l2_errors": 0}
+
+    def _l1_put(self, key: str, value, size: int):
+        # cachetools refuses values bigger than the whole cache
+        if size <= self.l1.maxsize:
+            self.l1[key] = (value, size)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shareable across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.l2_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            self._local.conn = conn
+        return conn
+
+    def _l2_get(self, key: str) -> str | None:
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def _l2_set(self, key: str, data: str):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, data, len(data), time.time()),
+        )
+        self._writes += 1
+        if self._writes % EVICTION_CHECK_INTERVAL == 0:
+            self._l2_evict(conn)
+
+    def _l2_evict(self, conn: sqlite3.Connection):
+        # Drop least recently used rows until the file is back under 90% of its budget
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.l2_max_bytes:
+            return
+        to_free = total - int(self.l2_max_bytes * 0.9)
+        keys = []
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+            keys.append(key)
+            to_free -= size
+            if to_free <= 0:
+                break
+        conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+        self.stats["l2_evictions"] += len(keys)
+
+    def _l2_delete(self, keys: list[str]):
+        self._conn().executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+
+    async def get(self, key: str, record_stats: bool = True):
+        # record_stats=False lets background jobs look at entries without skewing hit rates
+        key = self._key(key)
+        item = self.l1.get(key)
+        if item is not None:
+            if record_stats:
+                self.stats["l1_hits"] += 1
+            return item[0]
+        if self.l2_path is not None:
+            try:
+                data = await asyncio.to_thread(self._l2_get, key)
+            except sqlite3.Error as e:
+                self.stats["l2_errors"] += 1
+                print(f"L2 cache read failed: {str(e)}")
+                data = None
+            if data is not None:
+                value = json.loads(data)
+                self._l1_put(key, value, len(data))
+                if record_stats:
+                    self.stats["l2_hits"] += 1
+                return value
+        if record_stats:
+            self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value):
+        key = self._key(key)
+        data = json.dumps(value, default=str)
+        self._l1_put(key, value, len(data))
+        if self.l2_path is not None:
+            try:
+                await asyncio.to_thread(self._l2_set, key, data)
+            except sqlite3.Error as e:
+                self.stats["l2_errors"] += 1
+                print(f"L2 cache write failed: {str(e)}")
+
+    async def delete(self, *keys: str):
+        keys = [self._key(key) for key in keys]
+        for key in keys:
+            self.l1.pop(key, None)
+        if self.l2_path is not None:
+            try:
+                await asyncio.to_thread(self._l2_delete, keys)
+            except sqlite3.Error as e:
+                self.stats["l2_errors"] += 1
+                print(f"L2 cache delete failed: {str(e)}")
+
+    def snapshot_stats(self) -> dict:
+        return {**self.stats, "l1_entries": len(self.l1), "l1_bytes": self.l1.currsize}
@@ -0,0 +1,61 @@
+"""Cache invalidation channel between the write paths and the read caches.
+
+Write paths publish an event for a user to the Firestore `cache_invalidations`
+collection; every dashboard instance keeps a listener on it and drops the
+affected cached sections. Services outside this directory (e.g. the voice
+bot, which only talks to Supabase) publish through the dashboard's
+POST /dashboard/invalidate/ endpoint instead. feedback_written is published
+when a new feedback document is folded into its user's rollup, by the
+listener in feedback_rollups.watch_feedback().
+
+Published documents carry an `expire_at` field; configure a Firestore TTL
+policy on it so the collection does not grow without bound.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+INVALIDATION_COLLECTION = "cache_invalidations"
+EVENT_RETENTION = timedelta(days=1)
+
+# Which dashboard sections each write makes stale
+EVENT_SECTIONS = {
+    "session_saved": ["frontend_desc"],
+    "feedback_written": ["previous_feedback", "avg_scores", "summary"],
+    "summary_regenerated": ["summary"],
+}
+
+
+def publish_invalidation(db, user_id: str, event: str, source: str = ""):
+    if event not in EVENT_SECTIONS:
+        raise ValueError(f"Unknown cache event: {event}")
+    now = datetime.now(timezone.utc)
+    db.collection(INVALIDATION_COLLECTION).add({
+        "user_id": user_id,
+        "event": event,
+        "sections": EVENT_SECTIONS[event],
+        "source": source,
+        "timestamp": now,
+        "expire_at": now + EVENT_RETENTION,
+    })
+
+
+def subscribe(db, handler, loop: asyncio.AbstractEventLoop, events=None):
+    """Call `await handler(user_id, sections)` on `loop` for every new event
+    (or only for the given event names).
+
+    Firestore delivers snapshots on its own thread, so events are handed over
+    to the event loop. Returns the watch; call .unsubscribe() on shutdown.
+    """
+    started_at = datetime.now(timezone.utc)
+
+    def on_snapshot(docs, changes, read_time):
+        for change in changes:
+            if change.type.name != "ADDED":
+                continue
+            event = change.document.to_dict()
+            if events is not None and event.get("event") not in events:
+                continue
+            asyncio.run_coroutine_threadsafe(handler(event["user_id"], event.get("sections", [])), loop)
+
+    query = db.collection(INVALIDATION_COLLECTION).where("timestamp", ">", started_at)
+    return query.on_snapshot(on_snapshot)
@@ -0,0 +1,65 @@
+"""In-process versions of the dashboard's upstream services.
+
+singleAPI.py normally reaches summary.py, learning_points.py, the metrics
+service and tip_of_day.py over HTTP. Sections listed in
+DASHBOARD_EMBEDDED_SECTIONS are instead served by importing those modules and
+calling their query/aggregation functions directly, sharing the single
+Firestore client from firestore_db.py. The payloads match what the HTTP
+endpoints return, including {"detail": ...} bodies for 4xx errors.
+"""
+import importlib
+import inspect
+import os
+from fastapi import HTTPException
+from firestore_db import get_db, run_db
+
+# Metrics service the dashboard reads avg_scores from (must take only user_id)
+METRICS_MODULE = os.getenv("DASHBOARD_METRICS_MODULE", "analytics_metrics3")
+
+# section -> (module, function); every function takes user_id or no arguments
+HANDLERS = {
+    "summary": ("summary", "build_feedback_summary"),
+    "previous_feedback": ("learning_points", "latest_learning_points"),
+    "avg_scores": (METRICS_MODULE, "compute_feedback_averages"),
+    "tip_of_the_day": ("tip_of_day", "get_random_value"),
+}
+
+
+# Sections whose services keep their data current with the feedback listener
+ROLLUP_SECTIONS = {"previous_feedback", "avg_scores"}
+
+
+def watch_feedback(sections):
+    """Start the feedback listener if an embedded section relies on it.
+
+    The embedded services' own lifespans, which would start it, do not run in
+    the dashboard process. Returns the watch, or None.
+    """
+    from feedback_rollups import ROLLUP_WATCHER_ENABLED, watch_feedback as watch
+
+    if not ROLLUP_WATCHER_ENABLED or not ROLLUP_SECTIONS & set(sections):
+        return None
+    return watch(get_db())
+
+
+def load_handlers(sections):
+    """Import the service modules for the given sections only."""
+    unknown = set(sections) - set(HANDLERS)
+    if unknown:
+        raise ValueError(f"Sections cannot be embedded: {sorted(unknown)}")
+    return {
+        section: getattr(importlib.import_module(HANDLERS[section][0]), HANDLERS[section][1])
+        for section in sections
+    }
+
+
+async def call_handler(handler, params: dict | None = None):
+    try:
+        if inspect.iscoroutinefunction(handler):
+            return await handler(**(params or {}))
+        # The other service functions use the blocking Firestore client
+        return await run_db(handler, **(params or {}))
+    except HTTPException as e:
+        if e.status_code >= 500:
+            raise
+        return {"detail": e.detail}
@@ -0,0 +1,601 @@
+"""Per-user running score rollups for the /metrics/ services.
+
+feedback_rollups/{user_id} holds a running sum and count for every
+subcategory of every category map seen in the user's feedback documents:
+
+    {"categories": {"sales_and_persuasion": {"objection_handling": {"sum": 41.0, "count": 6}, ...}, ...},
+     "by_type": {"sales": {<categories for sales roleplays only>}, ...},
+     "averages": {"all": {"objection_handling": 6.8, ...}, "sales": {...}, ...},
+     "feedback_count": 6, "updated_at": ...}
+
+so /metrics/ is a single document read instead of a scan of the user's
+history. watch_feedback() listens on the feedback collection and folds in
+every new document; the services that read rollups start it (ROLLUP_WATCHER).
+POST /metrics/rollup/ does the same for one document on demand. Each document
+is applied at most once (tracked in the rollup's `applied` subcollection), so
+any number of instances may run the listener. A user's first document seen
+without a rollup builds the whole rollup from their history.
+
+feedback_rollup_meta/watermark holds the timestamp up to which every feedback
+document has been applied. A listener starts from there (less
+ROLLUP_REPLAY_OVERLAP), so documents written while no instance was running,
+for however long, are folded in when the next one starts.
+
+feedback_rollups/{user_id}/windows/recent is a ring buffer of the user's
+last RECENT_CAPACITY scored sessions, oldest first, which serves windowed
+averages and trends (GET /metrics/window/) at a cost bounded by the window
+rather than the user's whole history.
+
+leaderboards/{roleplay_type}:{subcategory} holds a histogram of every
+user's average on that board (see leaderboards.py). The same transaction
+that updates a rollup moves the user from the bin of their old average to
+the bin of the new one, using the rollup's `averages` (the "all" board
+averages over every roleplay type).
+
+latest_feedback/{user_id} points at the user's most recent feedback document
+and carries its learning points (the short_feedback of each item), so
+/learning_points/ reads one document:
+
+    {"feedback_id": ..., "timestamp": ..., "points": ["...", ...]}
+
+Existing users are built with:
+
+    python feedback_rollups.py backfill [--user-id USER_ID]
+    python feedback_rollups.py latest [--user-id USER_ID]
+"""
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query
+from firebase_admin import firestore
+from google.api_core.exceptions import GoogleAPICallError
+from cache_events import publish_invalidation
+from firestore_db import get_db, run_db, project, field_paths, counted, counted_doc
+from score_columns import CATEGORIES, ScoreColumns, numeric_score
+
+ROLLUP_COLLECTION = "feedback_rollups"
+APPLIED_COLLECTION = "applied"
+WINDOWS_COLLECTION = "windows"
+LATEST_COLLECTION = "latest_feedback"
+META_COLLECTION = "feedback_rollup_meta"
+LEADERBOARD_COLLECTION = "leaderboards"
+
+# Leaderboard histograms: averages binned at SKETCH_RESOLUTION, values outside
+# [SKETCH_MIN, SKETCH_MAX] clamped into the first/last bin
+SKETCH_MIN = 0.0
+SKETCH_MAX = 100.0
+SKETCH_RESOLUTION = 0.05
+SKETCH_BINS = int(round((SKETCH_MAX - SKETCH_MIN) / SKETCH_RESOLUTION)) + 1
+ALL_TYPES = "all"
+
+# Sessions kept per user for windowed metrics; day windows reach back at most this far
+RECENT_CAPACITY = 200
+
+# Fold new feedback documents in from a listener on the feedback collection. On
+# start it replays documents from a little before the watermark (writers' clocks
+# and commit order may disagree by that much), or, before any watermark exists,
+# from ROLLUP_CATCHUP back. Already-applied documents are skipped.
+ROLLUP_WATCHER_ENABLED = os.getenv("ROLLUP_WATCHER", "1") != "0"
+ROLLUP_CATCHUP = timedelta(hours=float(os.getenv("ROLLUP_CATCHUP_HOURS", "24")))
+ROLLUP_REPLAY_OVERLAP = timedelta(minutes=float(os.getenv("ROLLUP_REPLAY_OVERLAP_MINUTES", "60")))
+
+# Fields read from feedback documents; the long free-text `feedback` list is only
+# read for the one document a latest_feedback pointer is built from
+SCORE_FIELDS = list(CATEGORIES)
+ENTRY_FIELDS = ["user_id", "timestamp", "roleplay_type", "type"] + SCORE_FIELDS
+
+def feedback_scores(feedback_entry: dict) -> dict:
+    """{category: {subcategory: float or None}} for the category maps in one document.
+
+    Non-numeric values are kept as None so the subcategory still shows up in
+    the averages (as None), matching the old per-request calculation.
+    """
+    scores = {}
+    for category in CATEGORIES:
+        category_map = feedback_entry.get(category)
+        if isinstance(category_map, dict):
+            scores[category] = {
+                key: numeric_score(value) for key, value in category_map.items() if value is not None
+            }
+    return scores
+
+
+def build_rollup(feedback_entries) -> dict:
+    """Rollup `categories` map for a list of one user's feedback documents."""
+    stats = ScoreColumns.from_feedback(list(feedback_entries), user_of=lambda entry: None).aggregate()
+    return stats.rollup(0) if stats.users else {}
+
+
+def roleplay_type_of(feedback_entry: dict) -> str:
+    return feedback_entry.get("roleplay_type") or feedback_entry.get("type") or "unknown"
+
+
+def rollup_fields(feedback_entries) -> dict:
+    """`categories` and `by_type` of a rollup for a list of one user's feedback documents."""
+    by_type = {}
+    for feedback_entry in feedback_entries:
+        by_type.setdefault(roleplay_type_of(feedback_entry), []).append(feedback_entry)
+    return {
+        "categories": build_rollup(feedback_entries),
+        "by_type": {roleplay_type: build_rollup(entries) for roleplay_type, entries in by_type.items()},
+    }
+
+
+def subcategory_averages(categories: dict) -> dict:
+    """{subcategory: average} across every category map of a rollup."""
+    sums, counts = {}, {}
+    for totals in categories.values():
+        for key, total in totals.items():
+            sums[key] = sums.get(key, 0.0) + total["sum"]
+            counts[key] = counts.get(key, 0) + total["count"]
+    return {key: sums[key] / counts[key] for key in sums if counts[key] > 0}
+
+
+def board_averages(fields: dict) -> dict:
+    """{roleplay type or ALL_TYPES: {subcategory: average}} for a rollup's categories and by_type."""
+    averages = {ALL_TYPES: subcategory_averages(fields.get("categories", {}))}
+    for roleplay_type, categories in fields.get("by_type", {}).items():
+        averages[roleplay_type] = subcategory_averages(categories)
+    return averages
+
+
+def add_scores(categories: dict, scores: dict) -> dict:
+    """Rollup totals with one document's feedback_scores() added."""
+    totals = {category: {key: dict(total) for key, total in keys.items()} for category, keys in categories.items()}
+    for category, keys in scores.items():
+        for key, score in keys.items():
+            total = totals.setdefault(category, {}).setdefault(key, {"sum": 0.0, "count": 0})
+            if score is not None:
+                total["sum"] += score
+                total["count"] += 1
+    return totals
+
+
+def score_bin(value: float) -> int:
+    return min(max(int(round((value - SKETCH_MIN) / SKETCH_RESOLUTION)), 0), SKETCH_BINS - 1)
+
+
+def board_ref(db, roleplay_type: str, key: str):
+    return db.collection(LEADERBOARD_COLLECTION).document(f"{roleplay_type}:{key}")
+
+
+def _update_boards(transaction, db, old_averages: dict, new_averages: dict):
+    """Move a user between histogram bins on every board where their average changed bins."""
+    for roleplay_type in old_averages.keys() | new_averages.keys():
+        old = old_averages.get(roleplay_type, {})
+        new = new_averages.get(roleplay_type, {})
+        for key in old.keys() | new.keys():
+            old_bin = score_bin(old[key]) if key in old else None
+            new_bin = score_bin(new[key]) if key in new else None
+            if old_bin == new_bin:
+                continue
+            update = {"roleplay_type": roleplay_type, "subcategory": key, "bins": {}}
+            if old_bin is not None:
+                update["bins"][str(old_bin)] = firestore.Increment(-1)
+            if new_bin is not None:
+                update["bins"][str(new_bin)] = firestore.Increment(1)
+            if old_bin is None or new_bin is None:
+                update["users"] = firestore.Increment(1 if old_bin is None else -1)
+            transaction.set(board_ref(db, roleplay_type, key), update, merge=True)
+
+
+def category_averages(categories: dict, category: str) -> dict:
+    totals = categories.get(category, {})
+    return {key: (total["sum"] / total["count"]) if total["count"] > 0 else None for key, total in totals.items()}
+
+
+def combined_averages(categories: dict, subcategories) -> dict:
+    """Average each subcategory over every category map that has it."""
+    sums = {key: 0.0 for key in subcategories}
+    counts = {key: 0 for key in subcategories}
+    for totals in categories.values():
+        for key in subcategories:
+            if key in totals:
+                sums[key] += totals[key]["sum"]
+                counts[key] += totals[key]["count"]
+    return {key: (sums[key] / counts[key]) if counts[key] > 0 else None for key in subcategories}
+
+
+def session_entry(feedback_id: str, feedback_entry: dict) -> dict:
+    """Compact ring-buffer record for one scored session."""
+    entry = {"feedback_id": feedback_id, "timestamp": feedback_entry.get("timestamp")}
+    for category, scores in feedback_scores(feedback_entry).items():
+        entry[category] = scores
+    return entry
+
+
+def _session_time(entry: dict):
+    timestamp = entry.get("timestamp")
+    return timestamp.timestamp() if hasattr(timestamp, "timestamp") else 0
+
+
+def learning_points_of(feedback_entry: dict) -> list:
+    return [item.get("short_feedback") for item in feedback_entry.get("feedback", [])]
+
+
+def latest_pointer(feedback_id: str, feedback_entry: dict) -> dict:
+    return {
+        "feedback_id": feedback_id,
+        "timestamp": feedback_entry.get("timestamp"),
+        "points": learning_points_of(feedback_entry),
+    }
+
+
+def recent_ref(db, user_id: str):
+    return db.collection(ROLLUP_COLLECTION).document(user_id).collection(WINDOWS_COLLECTION).document("recent")
+
+
+def load_rollup_categories(db, user_id: str) -> dict:
+    """Category totals for a user, from the rollup or (if not built yet) a full scan.
+
+    Raises HTTPException(404) if the user has no feedback at all.
+    """
+    rollup_doc = counted_doc(db.collection(ROLLUP_COLLECTION).document(user_id).get(field_paths=["categories"]))
+    if rollup_doc.exists:
+        return rollup_doc.to_dict().get("categories", {})
+
+    query = project(db.collection("feedback").where("user_id", "==", user_id), SCORE_FIELDS)
+    results = [doc.to_dict() for doc in counted(query.stream())]
+    if not results:
+        raise HTTPException(status_code=404, detail="No feedback found for the given user_id")
+    return build_rollup(results)
+
+
+@firestore.transactional
+def _apply_feedback(transaction, db, feedback_id: str):
+    feedback_doc = db.collection("feedback").document(feedback_id).get(
+        field_paths=field_paths(ENTRY_FIELDS + ["feedback"]), transaction=transaction
+    )
+    if not feedback_doc.exists:
+        raise HTTPException(status_code=404, detail="Feedback not found")
+    feedback_entry = feedback_doc.to_dict()
+    user_id = feedback_entry["user_id"]
+
+    rollup_ref = db.collection(ROLLUP_COLLECTION).document(user_id)
+    applied_ref = rollup_ref.collection(APPLIED_COLLECTION).document(feedback_id)
+    if applied_ref.get(transaction=transaction).exists:
+        return user_id, False
+    rollup_doc = rollup_ref.get(field_paths=["categories", "by_type", "averages"], transaction=transaction)
+    if not rollup_doc.exists:
+        # No rollup yet: incrementing would start it from this one document
+        return user_id, None
+    rollup = rollup_doc.to_dict()
+
+    recent_doc = recent_ref(db, user_id).get(transaction=transaction)
+    sessions = recent_doc.to_dict().get("sessions", []) if recent_doc.exists else []
+    sessions.append(session_entry(feedback_id, feedback_entry))
+    sessions = sorted(sessions, key=_session_time)[-RECENT_CAPACITY:]
+
+    latest_ref = db.collection(LATEST_COLLECTION).document(user_id)
+    latest_doc = latest_ref.get(transaction=transaction)
+    # Feedback can be rolled up out of order; only move the pointer forwards
+    is_latest = not latest_doc.exists or _session_time(feedback_entry) >= _session_time(latest_doc.to_dict())
+
+    scores_by_category = feedback_scores(feedback_entry)
+    roleplay_type = roleplay_type_of(feedback_entry)
+    # The new averages of the boards this document moves: "all" and its roleplay type
+    averages = board_averages({
+        "categories": add_scores(rollup.get("categories", {}), scores_by_category),
+        "by_type": {roleplay_type: add_scores(rollup.get("by_type", {}).get(roleplay_type, {}), scores_by_category)},
+    })
+    old_averages = rollup.get("averages", {})
+    _update_boards(transaction, db, {board: old_averages.get(board, {}) for board in averages}, averages)
+
+    increments = {}
+    for category, scores in scores_by_category.items():
+        increments[category] = {
+            key: {
+                "sum": firestore.Increment(score if score is not None else 0.0),
+                "count": firestore.Increment(1 if score is not None else 0),
+            }
+            for key, score in scores.items()
+        }
+    transaction.set(rollup_ref, {
+        "categories": increments,
+        "by_type": {roleplay_type: increments},
+        "averages": averages,
+        "feedback_count": firestore.Increment(1),
+        "updated_at": datetime.now(timezone.utc),
+    }, merge=True)
+    transaction.set(recent_ref(db, user_id), {"sessions": sessions})
+    if is_latest:
+        transaction.set(latest_ref, latest_pointer(feedback_id, feedback_entry))
+    transaction.set(applied_ref, {"applied_at": datetime.now(timezone.utc)})
+    return user_id, True
+
+
+def record_feedback(db, feedback_id: str):
+    """Fold one feedback document into its user's rollup. Returns (user_id, applied)."""
+    user_id, applied = _apply_feedback(db.transaction(), db, feedback_id)
+    if applied is None:
+        # The user's first rollup is built from all of their documents, this one included
+        backfill(db, user_id)
+        backfill_latest(db, user_id)
+        applied = True
+    return user_id, applied
+
+
+def record_and_notify(db, feedback_id: str):
+    """record_feedback, then the invalidation event if it was applied."""
+    user_id, applied = record_feedback(db, feedback_id)
+    if applied:
+        publish_invalidation(db, user_id, "feedback_written", "metrics-rollup")
+    return user_id, applied
+
+
+def watermark_ref(db):
+    return db.collection(META_COLLECTION).document("watermark")
+
+
+@firestore.transactional
+def _advance_watermark(transaction, ref, timestamp):
+    watermark_doc = ref.get(transaction=transaction)
+    if watermark_doc.exists and watermark_doc.to_dict()["timestamp"] >= timestamp:
+        return
+    transaction.set(ref, {"timestamp": timestamp, "updated_at": datetime.now(timezone.utc)})
+
+
+def advance_watermark(db, timestamp):
+    """Record that every feedback document up to `timestamp` is applied (never moves back)."""
+    _advance_watermark(db.transaction(), watermark_ref(db), timestamp)
+
+
+def watch_feedback(db):
+    """Fold every new feedback document into its user's rollup as it is written.
+
+    The first snapshot replays the documents since the watermark, and the
+    watermark advances as documents are applied, but never past one that
+    failed: the next listener to start retries from there. Firestore
+    delivers snapshots on its own thread, which the rollup transactions run
+    on. Returns the watch; call .unsubscribe() on shutdown.
+    """
+    oldest_failure = None
+
+    def on_snapshot(docs, changes, read_time):
+        nonlocal oldest_failure
+        applied = []
+        for change in changes:
+            if change.type.name != "ADDED":
+                continue
+            timestamp = change.document.to_dict().get("timestamp")
+            try:
+                record_and_notify(db, change.document.id)
+                applied.append(timestamp)
+            except Exception as e:
+                print(f"Failed to roll up feedback {change.document.id}: {str(e)}")
+                if timestamp is not None and (oldest_failure is None or timestamp < oldest_failure):
+                    oldest_failure = timestamp
+
+        done = [timestamp for timestamp in applied if timestamp is not None and (oldest_failure is None or timestamp < oldest_failure)]
+        if done:
+            try:
+                advance_watermark(db, max(done))
+            except Exception as e:
+                print(f"Failed to advance the rollup watermark: {str(e)}")
+
+    watermark_doc = watermark_ref(db).get()
+    if watermark_doc.exists:
+        since = watermark_doc.to_dict()["timestamp"] - ROLLUP_REPLAY_OVERLAP
+    else:
+        since = datetime.now(timezone.utc) - ROLLUP_CATCHUP
+    return db.collection("feedback").where("timestamp", ">=", since).on_snapshot(on_snapshot)
+
+
+rollup_router = APIRouter()
+
+
+@rollup_router.post("/metrics/rollup/")
+async def rollup_feedback(feedback_id: str):
+    """Fold one feedback document in now, e.g. from a writer that needs the
+    rollup current before it responds (the listener would apply it shortly)."""
+    try:
+        user_id, applied = await run_db(record_and_notify, get_db(), feedback_id)
+        return {"message": "Rollup updated" if applied else "Already applied", "user_id": user_id}
+
+    except GoogleAPICallError as e:
+        raise HTTPException(status_code=500, detail=f"Firestore Error: {str(e)}")
+
+
+def _float_or_none(value):
+    return None if np.isnan(value) else float(value)
+
+
+def recent_sessions(db, user_id: str):
+    """(the user's sessions oldest first, whether that is all of them).
+
+    Reads the ring buffer, which holds at most RECENT_CAPACITY sessions. Until
+    it is built (by backfill or the user's next feedback), scans the user's
+    feedback like /metrics/ does.
+    """
+    recent_doc = counted_doc(recent_ref(db, user_id).get())
+    if recent_doc.exists:
+        sessions = recent_doc.to_dict().get("sessions", [])
+        return sessions, len(sessions) < RECENT_CAPACITY
+
+    query = project(db.collection("feedback").where("user_id", "==", user_id), ["timestamp"] + SCORE_FIELDS)
+    sessions = [session_entry(doc.id, doc.to_dict()) for doc in counted(query.stream())]
+    if not sessions:
+        raise HTTPException(status_code=404, detail="No feedback found for the given user_id")
+    return sorted(sessions, key=_session_time), True
+
+
+def window_metrics(db, user_id: str, last_n: int | None = None, days: int | None = None) -> dict:
+    """Averages, per-session trend slopes and score spread over the user's recent sessions."""
+    sessions, complete = recent_sessions(db, user_id)
+    truncated = False
+    if days is not None:
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).timestamp()
+        # A full ring buffer whose oldest session is inside the window may not reach back to its start
+        truncated = not complete and bool(sessions) and _session_time(sessions[0]) >= cutoff
+        sessions = [entry for entry in sessions if _session_time(entry) >= cutoff]
+    if last_n is not None:
+        sessions = sessions[-last_n:]
+    if not sessions:
+        raise HTTPException(status_code=404, detail="No feedback found in the requested window")
+
+    columns = ScoreColumns.from_feedback(sessions, user_of=lambda entry: None)
+    stats = columns.aggregate()
+    slopes = columns.trend_slopes()
+
+    averages, trend = {}, {}
+    for column, (category, key) in enumerate(columns.columns):
+        averages.setdefault(category, {})[key] = _float_or_none(stats.means[0, column])
+        trend.setdefault(category, {})[key] = _float_or_none(slopes[0, column])
+
+    return {
+        "window": {"last_n": last_n, "days": days, "sessions": len(sessions), "truncated": truncated},
+        "averages": averages,
+        "trend": trend,
+        "stats": stats.summary(0),
+    }
+
+
+@rollup_router.get("/metrics/window/")
+async def get_window_metrics(
+    user_id: str,
+    last_n: int | None = Query(None, ge=1, le=RECENT_CAPACITY, description="Last N sessions"),
+    days: int | None = Query(None, ge=1, le=90, description="Sessions from the last N days, e.g. 7, 30 or 90"),
+):
+    """Windowed averages plus a trend slope (score change per session) and the
+    count, min, max and standard deviation of the scores per subcategory.
+
+    Only the last RECENT_CAPACITY sessions are kept; `window.truncated` is true
+    when a `days` window reaches further back than that.
+    """
+    if last_n is None and days is None:
+        raise HTTPException(status_code=400, detail="Pass last_n and/or days")
+    try:
+        return await run_db(window_metrics, get_db(), user_id, last_n, days)
+
+    except GoogleAPICallError as e:
+        raise HTTPException(status_code=500, detail=f"Firestore Error: {str(e)}")
+
+
+@firestore.transactional
+def _replace_rollup(transaction, db, uid: str, fields: dict, feedback_entries: list, sessions: list, feedback_ids: list) -> int:
+    """Overwrite a user's rollup and ring buffer with rebuilt ones, and move the user on
+    the leaderboards accordingly; returns the document count.
+
+    Documents the listener applied after the rebuild's scan (applied, but not
+    in `feedback_ids`) are merged in rather than wiped. The listener's
+    transaction reads and writes the rollup document too, so it either commits
+    before this one reads the applied markers or retries after it.
+    """
+    rollup_ref = db.collection(ROLLUP_COLLECTION).document(uid)
+    rollup_doc = rollup_ref.get(field_paths=["averages"], transaction=transaction)
+    old_averages = rollup_doc.to_dict().get("averages", {}) if rollup_doc.exists else {}
+    applied = {doc.id for doc in rollup_ref.collection(APPLIED_COLLECTION).select([]).stream(transaction=transaction)}
+    missing = applied - set(feedback_ids)
+    if missing:
+        refs = [db.collection("feedback").document(feedback_id) for feedback_id in missing]
+        extra = [doc for doc in db.get_all(refs, field_paths=field_paths(ENTRY_FIELDS), transaction=transaction) if doc.exists]
+        feedback_entries = feedback_entries + [doc.to_dict() for doc in extra]
+        sessions = sessions + [session_entry(doc.id, doc.to_dict()) for doc in extra]
+        fields = rollup_fields(feedback_entries)
+
+    averages = board_averages(fields)
+    _update_boards(transaction, db, old_averages, averages)
+    transaction.set(recent_ref(db, uid), {"sessions": sorted(sessions, key=_session_time)[-RECENT_CAPACITY:]})
+    transaction.set(rollup_ref, {
+        **fields,
+        "averages": averages,
+        "feedback_count": len(feedback_entries),
+        "updated_at": datetime.now(timezone.utc),
+    })
+    return len(feedback_entries)
+
+
+def backfill(db, user_id: str | None = None):
+    """Rebuild rollups from scratch from the feedback collection."""
+    query = db.collection("feedback")
+    if user_id:
+        query = query.where("user_id", "==", user_id)
+    query = project(query, ENTRY_FIELDS)
+
+    by_user = {}
+    user_entries = {}
+    entries = []
+    recent = {}
+    for doc in query.stream():
+        feedback_entry = doc.to_dict()
+        if feedback_entry.get("user_id"):
+            by_user.setdefault(feedback_entry["user_id"], []).append(doc.id)
+            user_entries.setdefault(feedback_entry["user_id"], []).append(feedback_entry)
+            entries.append(feedback_entry)
+            recent.setdefault(feedback_entry["user_id"], []).append(session_entry(doc.id, feedback_entry))
+
+    # Every user's totals in one vectorized pass, overall and per roleplay type
+    stats = ScoreColumns.from_feedback(entries).aggregate()
+    type_stats = ScoreColumns.from_feedback(
+        entries, user_of=lambda entry: (entry["user_id"], roleplay_type_of(entry))
+    ).aggregate()
+    by_type = {}
+    for index, (uid, roleplay_type) in enumerate(type_stats.users):
+        by_type.setdefault(uid, {})[roleplay_type] = type_stats.rollup(index)
+
+    for user_index, uid in enumerate(stats.users):
+        feedback_ids = by_user[uid]
+        rollup_ref = db.collection(ROLLUP_COLLECTION).document(uid)
+        # Mark every document as applied so the listener does not count it again. This
+        # goes first: until the rollup exists, the listener rebuilds it instead of adding.
+        batch = db.batch()
+        for i, feedback_id in enumerate(feedback_ids, start=1):
+            batch.set(rollup_ref.collection(APPLIED_COLLECTION).document(feedback_id), {"applied_at": datetime.now(timezone.utc)})
+            if i % 400 == 0:
+                batch.commit()
+                batch = db.batch()
+        batch.commit()
+        fields = {"categories": stats.rollup(user_index), "by_type": by_type[uid]}
+        count = _replace_rollup(db.transaction(), db, uid, fields, user_entries[uid], recent[uid], feedback_ids)
+        print(f"Rolled up {count} feedback documents for {uid}")
+
+    timestamps = [entry["timestamp"] for entry in entries if entry.get("timestamp")]
+    if user_id is None and timestamps:
+        # Everything up to the newest scanned document is applied now
+        advance_watermark(db, max(timestamps))
+
+    print(f"Backfilled rollups for {len(by_user)} users")
+
+
+def backfill_latest(db, user_id: str | None = None):
+    """Build latest_feedback pointers for existing users."""
+    query = db.collection("feedback")
+    if user_id:
+        query = query.where("user_id", "==", user_id)
+
+    # Timestamps only; the feedback text is read for each user's latest document alone
+    latest = {}
+    for doc in counted(project(query, ["user_id", "timestamp"]).stream()):
+        feedback_entry = doc.to_dict()
+        uid = feedback_entry.get("user_id")
+        if uid and (uid not in latest or _session_time(feedback_entry) >= _session_time(latest[uid][1])):
+            latest[uid] = (doc.id, feedback_entry)
+
+    uids = list(latest)
+    for start in range(0, len(uids), 100):
+        chunk = uids[start:start + 100]
+        owners = {latest[uid][0]: uid for uid in chunk}
+        refs = [db.collection("feedback").document(feedback_id) for feedback_id in owners]
+        batch = db.batch()
+        for doc in counted(db.get_all(refs, field_paths=field_paths(["timestamp", "feedback"]))):
+            if doc.exists:
+                batch.set(db.collection(LATEST_COLLECTION).document(owners[doc.id]), latest_pointer(doc.id, doc.to_dict()))
+        batch.commit()
+
+    print(f"Built latest feedback pointers for {len(uids)} users")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain per-user feedback score rollups")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Rebuild rollups from the feedback collection")
+    backfill_parser.add_argument("--user-id", help="Only rebuild this user's rollup")
+    latest_parser = subparsers.add_parser("latest", help="Build latest_feedback pointers from the feedback collection")
+    latest_parser.add_argument("--user-id", help="Only rebuild this user's pointer")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        backfill(get_db(), args.user_id)
+    elif args.command == "latest":
+        backfill_latest(get_db(), args.user_id)
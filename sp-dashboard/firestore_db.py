@@ -0,0 +1,113 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+# Set to 0 to read whole feedback documents again (to compare X-Firestore-Read-Bytes before/after)
+FIELD_PROJECTION = os.getenv("FIRESTORE_FIELD_PROJECTION", "1") != "0"
+
+# Blocking Firestore calls from async endpoints run on this many threads. The client
+# (and its gRPC channel) is shared by all of them. FIRESTORE_OFFLOAD=0 runs them
+# inline on the event loop again, for comparison with bench_concurrency.py.
+FIRESTORE_MAX_WORKERS = int(os.getenv("FIRESTORE_MAX_WORKERS", "32"))
+FIRESTORE_OFFLOAD = os.getenv("FIRESTORE_OFFLOAD", "1") != "0"
+_executor = ThreadPoolExecutor(max_workers=FIRESTORE_MAX_WORKERS, thread_name_prefix="firestore")
+
+# Process-wide totals, and per-request totals for the request being served
+read_stats = {"requests": 0, "documents": 0, "bytes": 0}
+_request_reads = ContextVar("firestore_request_reads", default=None)
+
+
+def get_db():
+    """Return the process-wide Firestore client, initializing Firebase on first use.
+
+    Every service in this directory goes through here, so several of them can
+    be imported into one process (see embedded_sections.py) and share a client.
+    """
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        cred = credentials.Certificate(os.getenv("CRED_PATH"))
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking Firestore function off the event loop, on the bounded Firestore pool."""
+    if not FIRESTORE_OFFLOAD:
+        return func(*args, **kwargs)
+    # Copy the context so per-request read stats still reach measure_reads()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_executor, call)
+
+
+def project(query, fields):
+    """Restrict a query to `fields` unless projection is switched off."""
+    return query.select(fields) if FIELD_PROJECTION else query
+
+
+def field_paths(fields):
+    """`field_paths` argument for DocumentReference.get / Client.get_all."""
+    return list(fields) if FIELD_PROJECTION else None
+
+
+def value_size(value) -> int:
+    """Approximate stored size of a Firestore value (Firestore's storage size rules)."""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key.encode("utf-8")) + 1 + value_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(value_size(item) for item in value)
+    return 16
+
+
+def _record(snapshot):
+    if not snapshot.exists:
+        return
+    size = value_size(snapshot.to_dict()) + 16 + sum(len(part) + 1 for part in snapshot.reference.path.split("/"))
+    read_stats["documents"] += 1
+    read_stats["bytes"] += size
+    request_reads = _request_reads.get()
+    if request_reads is not None:
+        request_reads["documents"] += 1
+        request_reads["bytes"] += size
+
+
+def counted(snapshots):
+    """Pass document snapshots through, adding their size to the read stats."""
+    for snapshot in snapshots:
+        _record(snapshot)
+        yield snapshot
+
+
+def counted_doc(snapshot):
+    _record(snapshot)
+    return snapshot
+
+
+def measure_reads(app):
+    """Report each request's Firestore reads in X-Firestore-Read-Docs/-Bytes headers."""
+    @app.middleware("http")
+    async def firestore_read_headers(request, call_next):
+        request_reads = {"documents": 0, "bytes": 0}
+        token = _request_reads.set(request_reads)
+        try:
+            response = await call_next(request)
+        finally:
+            _request_reads.reset(token)
+        read_stats["requests"] += 1
+        response.headers["X-Firestore-Read-Docs"] = str(request_reads["documents"])
+        response.headers["X-Firestore-Read-Bytes"] = str(request_reads["bytes"])
+        return response
@@ -0,0 +1,30 @@
+import hashlib
+import json
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+
+def content_hash(payload) -> str:
+    """Stable hash of a JSON-serializable payload (independent of dict order)."""
+    data = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    # Weak comparison, as required for If-None-Match
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def conditional_json(request: Request, payload, cache_control: str, etag: str | None = None) -> Response:
+    """Return payload as JSON with an ETag, or an empty 304 if the client already has it."""
+    etag = etag or f'W/"{content_hash(payload)}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
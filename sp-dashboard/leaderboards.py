@@ -0,0 +1,104 @@
+"""Org-wide percentile ranks and leaderboards for subcategory averages.
+
+For every (roleplay_type, subcategory) board, leaderboards/{roleplay_type}:{subcategory}
+holds a histogram of every user's average on that board. A user's average
+moves with every new session, so the sketch has to support replacing a
+user's old value; it is a fixed-resolution histogram, which (unlike KLL or
+t-digest) supports removal, and is still mergeable by adding bin counts,
+which is how the Firestore Increment updates apply. The rollup transaction
+in feedback_rollups.py moves the user between bins and keeps the averages
+on the rollup (averages.{roleplay_type}.{subcategory}), so:
+
+- a percentile rank is the user's rollup field and the board document, two
+  reads whatever the number of users or sessions
+- the top N are a descending query on that rollup field with limit N,
+  served by Firestore's automatic single-field index (N reads)
+
+Deployments with rollups from before the boards existed fill them with
+`python feedback_rollups.py backfill`.
+"""
+from fastapi import APIRouter, HTTPException, Query
+from firebase_admin import firestore
+from google.api_core.exceptions import GoogleAPICallError
+from feedback_rollups import ROLLUP_COLLECTION, ALL_TYPES, board_ref, score_bin
+from firestore_db import get_db, run_db, project, field_paths, counted, counted_doc
+
+
+class ScoreSketch:
+    def __init__(self, bins: dict):
+        # Sparse {bin index: users}; bins a user has left can hold 0
+        self.counts = {int(index): count for index, count in bins.items() if count > 0}
+        self.total = sum(self.counts.values())
+
+    @classmethod
+    def from_doc(cls, board_doc) -> "ScoreSketch":
+        return cls(board_doc.to_dict().get("bins", {}) if board_doc.exists else {})
+
+    def percentile_rank(self, value: float) -> float | None:
+        """Share of values below `value` (ties count half), in percent."""
+        if self.total == 0:
+            return None
+        index = score_bin(value)
+        below = sum(count for bin_index, count in self.counts.items() if bin_index < index)
+        return 100.0 * (below + 0.5 * self.counts.get(index, 0)) / self.total
+
+
+def average_path(roleplay_type: str, key: str) -> str:
+    return firestore.Client.field_path("averages", roleplay_type, key)
+
+
+def stored_average(rollup: dict, roleplay_type: str, key: str):
+    return rollup.get("averages", {}).get(roleplay_type, {}).get(key)
+
+
+def user_percentile(db, roleplay_type: str, key: str, user_id: str):
+    path = average_path(roleplay_type, key)
+    rollup_doc = counted_doc(db.collection(ROLLUP_COLLECTION).document(user_id).get(field_paths=field_paths([path])))
+    average = stored_average(rollup_doc.to_dict(), roleplay_type, key) if rollup_doc.exists else None
+    if average is None:
+        return None
+    sketch = ScoreSketch.from_doc(counted_doc(board_ref(db, roleplay_type, key).get()))
+    return {"average": average, "percentile": sketch.percentile_rank(average), "users": sketch.total}
+
+
+def top_users(db, roleplay_type: str, key: str, limit: int) -> list:
+    path = average_path(roleplay_type, key)
+    query = db.collection(ROLLUP_COLLECTION).order_by(path, direction=firestore.Query.DESCENDING).limit(limit)
+    return [
+        {"user_id": doc.id, "average": stored_average(doc.to_dict(), roleplay_type, key)}
+        for doc in counted(project(query, [path]).stream())
+    ]
+
+
+leaderboard_router = APIRouter()
+
+
+@leaderboard_router.get("/metrics/percentile/")
+async def get_percentile(
+    user_id: str,
+    subcategory: str,
+    roleplay_type: str = Query(ALL_TYPES, description="'all' or a roleplay type such as 'sales'"),
+):
+    """Where the user's average for a subcategory sits among all users."""
+    try:
+        result = await run_db(user_percentile, get_db(), roleplay_type, subcategory, user_id)
+    except GoogleAPICallError as e:
+        raise HTTPException(status_code=500, detail=f"Firestore Error: {str(e)}")
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="No scores found for the given user_id and subcategory")
+    return {"user_id": user_id, "subcategory": subcategory, "roleplay_type": roleplay_type, **result}
+
+
+@leaderboard_router.get("/metrics/leaderboard/")
+async def get_leaderboard(
+    subcategory: str,
+    roleplay_type: str = Query(ALL_TYPES, description="'all' or a roleplay type such as 'sales'"),
+    limit: int = Query(10, ge=1, le=100),
+):
+    try:
+        leaders = await run_db(top_users, get_db(), roleplay_type, subcategory, limit)
+    except GoogleAPICallError as e:
+        raise HTTPException(status_code=500, detail=f"Firestore Error: {str(e)}")
+
+    return {"subcategory": subcategory, "roleplay_type": roleplay_type, "leaders": leaders}
@@ -1,11 +1,23 @@
 from fastapi import FastAPI, HTTPException,Query
-import firebase_admin
-from firebase_admin import credentials, firestore
-import os
+from firestore_db import get_db, run_db, project, field_paths, counted, counted_doc, measure_reads
+from feedback_rollups import LATEST_COLLECTION, ROLLUP_WATCHER_ENABLED, watch_feedback
 from fastapi.middleware.cors import CORSMiddleware
 from google.api_core.exceptions import GoogleAPICallError
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Moves the latest_feedback pointers as feedback is written (see feedback_rollups.py)
+    watch = watch_feedback(db) if ROLLUP_WATCHER_ENABLED else None
+    try:
+        yield
+    finally:
+        if watch is not None:
+            watch.unsubscribe()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,33 +26,39 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+measure_reads(app)
 
 # Initialize Firebase
-cred = credentials.Certificate(os.getenv("CRED_PATH"))
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+db = get_db()
 
-@app.get("/learning_points/")
-async def get_latest_feedback(user_id: str):
-    try:
-        feedback_ref = db.collection("feedback")
+def latest_learning_points(user_id: str):
+    # One read: the pointer kept current by the feedback listener (see feedback_rollups.py)
+    latest_doc = counted_doc(db.collection(LATEST_COLLECTION).document(user_id).get(field_paths=["points"]))
+    if latest_doc.exists:
+        return {"points": latest_doc.to_dict().get("points", [])}
+
+    # No pointer yet: find the newest document from timestamps only (sorted in
+    # Python, so no composite index is needed), then read its feedback
+    feedback_ref = db.collection("feedback")
+    query = project(feedback_ref.where("user_id", "==", user_id), ["timestamp"])
+    results = [(doc.id, doc.to_dict()) for doc in counted(query.stream())]
+
+    if results:
+        latest_id = max(results, key=lambda x: x[1].get('timestamp', 0))[0]
+        latest_feedback = counted_doc(feedback_ref.document(latest_id).get(field_paths=field_paths(["feedback"]))).to_dict()
+        # Extract all short_feedback from the list
+        short_feedback_list = [item["short_feedback"] for item in latest_feedback["feedback"]]
 
-        # Just filter by user_id without ordering in Firestore
-        query = feedback_ref.where("user_id", "==", user_id)
+        return {"points": short_feedback_list}
 
-        # Execute query
-        results = [doc.to_dict() for doc in query.stream()]
+    else:
+        raise HTTPException(status_code=404, detail="No feedback found for the given user_id")
 
-        if results:
-            # Sort in Python by timestamp
-            latest_feedback = max(results, key=lambda x: x.get('timestamp', 0))
-            # Extract all short_feedback from the list
-            short_feedback_list = [item["short_feedback"] for item in latest_feedback["feedback"]]
 
-            return {"points": short_feedback_list}
-                
-        else:
-            raise HTTPException(status_code=404, detail="No feedback found for the given user_id")
+@app.get("/learning_points/")
+async def get_latest_feedback(user_id: str):
+    try:
+        return await run_db(latest_learning_points, user_id)
 
     except GoogleAPICallError as e:
         raise HTTPException(status_code=500, detail=f"Firestore Error: {str(e)}")
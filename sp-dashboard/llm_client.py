@@ -0,0 +1,205 @@
+"""Async, concurrency-limited OpenAI chat client.
+
+ChatCompletion.acreate runs on the event loop, so a multi-second GPT-4 call
+no longer holds a worker thread or blocks other requests. All calls in the
+process share one LLMClient, which:
+
+- caps concurrent calls (LLM_MAX_CONCURRENCY); callers beyond that wait
+- bounds each attempt with a timeout (LLM_TIMEOUT_SECONDS)
+- retries rate limits, timeouts and transient API errors with exponential
+  backoff and jitter (LLM_MAX_RETRIES), honouring Retry-After when given
+- keeps latency and token counters for the service's stats endpoint
+
+stream_chat() yields completion tokens as they arrive, for endpoints that
+show partial output.
+"""
+import asyncio
+import os
+import random
+import time
+import openai
+from openai import error as openai_error
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+RETRYABLE_ERRORS = (
+    openai_error.RateLimitError,
+    openai_error.Timeout,
+    openai_error.APIConnectionError,
+    openai_error.ServiceUnavailableError,
+    openai_error.APIError,
+)
+
+
+class LLMTimeoutError(Exception):
+    pass
+
+
+def _retry_after(error) -> float | None:
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+    ):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.inflight = 0
+        self.stats = {
+            "calls": 0,
+            "failures": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "timeouts": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "latency_seconds_total": 0.0,
+            "latency_seconds_max": 0.0,
+            "streams": 0,
+            "first_token_seconds_total": 0.0,
+        }
+
+    def _backoff(self, attempt: int, error) -> float:
+        delay = _retry_after(error)
+        if delay is None:
+            delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+            delay = random.uniform(delay / 2, delay)
+        return delay
+
+    def _record_latency(self, started: float):
+        latency = time.perf_counter() - started
+        self.stats["latency_seconds_total"] += latency
+        self.stats["latency_seconds_max"] = max(self.stats["latency_seconds_max"], latency)
+
+    def _failed_attempt(self, error, attempt: int) -> float:
+        """Count a failed attempt; raise if it is out of retries, else return the backoff delay."""
+        if isinstance(error, openai_error.RateLimitError):
+            self.stats["rate_limited"] += 1
+        elif isinstance(error, (asyncio.TimeoutError, openai_error.Timeout)):
+            self.stats["timeouts"] += 1
+        if attempt >= self.max_retries:
+            self.stats["failures"] += 1
+            if isinstance(error, asyncio.TimeoutError):
+                raise LLMTimeoutError(f"LLM call timed out after {self.timeout}s") from error
+            raise error
+        self.stats["retries"] += 1
+        return self._backoff(attempt, error)
+
+    async def _with_retries(self, call):
+        """Run `call()` (one attempt) under the concurrency limit, retrying transient failures."""
+        attempt = 0
+        while True:
+            try:
+                async with self.semaphore:
+                    self.inflight += 1
+                    try:
+                        return await call()
+                    finally:
+                        self.inflight -= 1
+            except (asyncio.TimeoutError, *RETRYABLE_ERRORS) as e:
+                # Sleep outside the semaphore so waiting callers can use the slot
+                await asyncio.sleep(self._failed_attempt(e, attempt))
+                attempt += 1
+            except Exception:
+                self.stats["failures"] += 1
+                raise
+
+    async def chat(self, messages: list, model: str = "gpt-4", **kwargs) -> str:
+        """Content of the first choice of a chat completion."""
+        async def attempt():
+            started = time.perf_counter()
+            response = await asyncio.wait_for(
+                openai.ChatCompletion.acreate(model=model, messages=messages, **kwargs),
+                timeout=self.timeout,
+            )
+            self._record_latency(started)
+            usage = response.get("usage") or {}
+            self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            self.stats["completion_tokens"] += usage.get("completion_tokens", 0)
+            return response["choices"][0]["message"]["content"]
+
+        self.stats["calls"] += 1
+        return await self._with_retries(attempt)
+
+    async def stream_chat(self, messages: list, model: str = "gpt-4", **kwargs):
+        """Yield content deltas of a streamed chat completion as they arrive.
+
+        The concurrency slot is held until the stream ends. Retries only happen
+        before the first token; after that every chunk must arrive within the timeout.
+        """
+        self.stats["calls"] += 1
+        attempt = 0
+        while True:
+            await self.semaphore.acquire()
+            self.inflight += 1
+            started = time.perf_counter()
+            try:
+                stream = await asyncio.wait_for(
+                    openai.ChatCompletion.acreate(model=model, messages=messages, stream=True, **kwargs),
+                    timeout=self.timeout,
+                )
+                chunk = await asyncio.wait_for(stream.__anext__(), timeout=self.timeout)
+                break
+            except (asyncio.TimeoutError, *RETRYABLE_ERRORS) as e:
+                self.inflight -= 1
+                self.semaphore.release()
+                await asyncio.sleep(self._failed_attempt(e, attempt))
+                attempt += 1
+            except BaseException as e:
+                self.inflight -= 1
+                self.semaphore.release()
+                if isinstance(e, Exception):
+                    self.stats["failures"] += 1
+                raise
+
+        self.stats["streams"] += 1
+        self.stats["first_token_seconds_total"] += time.perf_counter() - started
+        try:
+            while True:
+                # Streamed responses carry no usage; each chunk is one completion token
+                self.stats["completion_tokens"] += 1
+                delta = chunk["choices"][0]["delta"].get("content")
+                if delta:
+                    yield delta
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=self.timeout)
+                except StopAsyncIteration:
+                    break
+            self._record_latency(started)
+        except asyncio.TimeoutError as e:
+            self.stats["timeouts"] += 1
+            self.stats["failures"] += 1
+            raise LLMTimeoutError(f"LLM stream stalled for {self.timeout}s") from e
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        finally:
+            self.inflight -= 1
+            self.semaphore.release()
+
+    def snapshot_stats(self) -> dict:
+        succeeded = self.stats["calls"] - self.stats["failures"]
+        return {
+            **self.stats,
+            "inflight": self.inflight,
+            "latency_seconds_avg": self.stats["latency_seconds_total"] / succeeded if succeeded > 0 else None,
+            "first_token_seconds_avg": (
+                self.stats["first_token_seconds_total"] / self.stats["streams"] if self.stats["streams"] else None
+            ),
+        }
+
+
+llm = LLMClient()
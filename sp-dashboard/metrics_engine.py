@@ -0,0 +1,155 @@
+"""One /metrics/ engine for every response shape.
+
+The three metrics services used to hard-code their own category lists and
+walk the totals in their own way. Here the categories and subcategories
+each audience (sales or customer) is scored on are declared once in
+METRICS_SCHEMA. That schema is compiled at import into tuples of keys, and
+a single pass over a user's rollup totals feeds any of the shapes:
+
+    flat    {"averages": {subcategory: avg}} for the categories of `user_type`
+    nested  {"averages": {audience: {category: {subcategory: avg}}}}
+    split   {"averages": {audience: {subcategory: avg}}}, each subcategory
+            averaged over every category map that has it
+
+analytic_metrics.py is the service; analytics_metrics2.py and
+analytics_metrics3.py keep their old default shape for existing deployments.
+"""
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.middleware.cors import CORSMiddleware
+from google.api_core.exceptions import GoogleAPICallError
+from feedback_rollups import ROLLUP_WATCHER_ENABLED, load_rollup_categories, rollup_router, watch_feedback
+from firestore_db import get_db, run_db, measure_reads
+from http_cache import conditional_json
+from leaderboards import leaderboard_router
+
+METRICS_SCHEMA = {
+    "sales": {
+        "categories": ["sales_and_persuasion", "professionalism_and_presentation"],
+        "subcategories": [
+            "product_knowledge_score", "persuasion_and_negotiation_skills", "objection_handling",
+            "confidence_score", "value_proposition", "call_to_action_effectiveness",
+            "questioning_technique", "rapport_building", "active_listening_skills",
+            "upselling_success_rate", "engagement", "stuttering_words",
+        ],
+    },
+    "customer": {
+        "categories": ["communication_and_delivery", "customer_interaction_and_resolution"],
+        "subcategories": [
+            "empathy_score", "clarity_and_conciseness", "grammar_and_language",
+            "listening_score", "problem_resolution_effectiveness", "personalisation_index",
+            "conflict_management", "response_time", "customer_satisfaction_score",
+            "positive_sentiment_score", "structure_and_flow", "stuttering_words",
+        ],
+    },
+}
+
+SHAPES = ("flat", "nested", "split")
+
+# Averages only change when a new session is scored; clients may reuse them briefly
+METRICS_CACHE_CONTROL = "private, max-age=60"
+
+
+class CompiledSchema:
+    def __init__(self, schema: dict):
+        self.audiences = tuple(schema)
+        self.categories = {audience: tuple(spec["categories"]) for audience, spec in schema.items()}
+        self.subcategories = {audience: tuple(spec["subcategories"]) for audience, spec in schema.items()}
+
+    def averages(self, totals: dict):
+        """One pass over rollup totals -> ({category: {key: avg}}, {key: avg over all maps})."""
+        per_category = {}
+        sums, counts = {}, {}
+        for category, subtotals in totals.items():
+            averages = {}
+            for key, total in subtotals.items():
+                total_sum, total_count = total["sum"], total["count"]
+                averages[key] = (total_sum / total_count) if total_count > 0 else None
+                sums[key] = sums.get(key, 0.0) + total_sum
+                counts[key] = counts.get(key, 0) + total_count
+            per_category[category] = averages
+        combined = {key: (sums[key] / counts[key]) if counts[key] > 0 else None for key in sums}
+        return per_category, combined
+
+    def render(self, totals: dict, shape: str, user_type: str | None = None) -> dict:
+        if shape not in SHAPES:
+            raise HTTPException(status_code=400, detail=f"Invalid shape. Must be one of {', '.join(SHAPES)}.")
+        if shape == "flat" and user_type not in self.categories:
+            raise HTTPException(status_code=400, detail="Invalid user_type. Must be 'customer' or 'sales'.")
+
+        per_category, combined = self.averages(totals)
+        if shape == "flat":
+            flat = {}
+            for category in self.categories[user_type]:
+                flat.update(per_category.get(category, {}))
+            return {"averages": flat}
+        if shape == "nested":
+            return {"averages": {
+                audience: {
+                    category: per_category[category]
+                    for category in self.categories[audience] if category in per_category
+                }
+                for audience in self.audiences
+            }}
+        return {"averages": {
+            audience: {key: combined.get(key) for key in self.subcategories[audience]}
+            for audience in self.audiences
+        }}
+
+
+schema = CompiledSchema(METRICS_SCHEMA)
+
+
+def compute_feedback_averages(user_id: str, shape: str, user_type: str | None = None):
+    # One read of the user's running totals
+    return schema.render(load_rollup_categories(get_db(), user_id), shape, user_type)
+
+
+def create_metrics_app(default_shape: str) -> FastAPI:
+    """The /metrics/ service, answering in `default_shape` unless ?shape= is given."""
+    if default_shape not in SHAPES:
+        raise ValueError(f"Unknown metrics shape: {default_shape}")
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Keeps the per-user rollups current as feedback is written
+        watch = watch_feedback(get_db()) if ROLLUP_WATCHER_ENABLED else None
+        try:
+            yield
+        finally:
+            if watch is not None:
+                watch.unsubscribe()
+
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    measure_reads(app)
+
+    # POST /metrics/rollup/ folds in one feedback document on demand
+    app.include_router(rollup_router)
+    app.include_router(leaderboard_router)
+
+    @app.get("/metrics/")
+    async def get_feedback_averages(
+        user_id: str,
+        request: Request,
+        user_type: str | None = Query(None, description="User type: 'customer' or 'sales' (flat shape only)"),
+        shape: str = Query(default_shape, description="Response shape: 'flat', 'nested' or 'split'"),
+    ):
+        try:
+            averages = await run_db(compute_feedback_averages, user_id, shape, user_type)
+            return conditional_json(request, averages, METRICS_CACHE_CONTROL)
+
+        except HTTPException:
+            raise
+        except GoogleAPICallError as e:
+            raise HTTPException(status_code=500, detail=f"Firestore Error: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+
+    return app
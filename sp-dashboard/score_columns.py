@@ -0,0 +1,177 @@
+"""Columnar, vectorized aggregation of feedback subcategory scores.
+
+Feedback documents are packed once into a (rows x columns) float matrix,
+one row per document and one column per (category, subcategory) pair, with
+a validity mask for numeric values and a presence mask for keys that were
+set at all. Means, counts, min/max and standard deviations for every user
+and column then come out of a handful of NumPy reductions instead of a
+Python loop per key.
+
+Missing, None and non-numeric values are skipped exactly like the old
+per-request calculate_averages(): they never count towards a mean, but a
+key that was present (even with a non-numeric value) still shows up, with
+a None average.
+"""
+import numpy as np
+
+# Top-level category maps in a feedback document
+CATEGORIES = [
+    "communication_and_delivery", "customer_interaction_and_resolution",
+    "sales_and_persuasion", "professionalism_and_presentation",
+]
+
+
+def numeric_score(value):
+    """float(value), or None for missing and non-numeric values (which are skipped)."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ScoreColumns:
+    def __init__(self, users, columns, row_users, values, valid, present):
+        self.users = users  # user ids, in row-group order
+        self.columns = columns  # [(category, subcategory)]
+        self.row_users = row_users  # (n_rows,) index into users
+        self.values = values  # (n_rows, n_columns) float64, 0.0 where not valid
+        self.valid = valid  # (n_rows, n_columns) numeric value present
+        self.present = present  # (n_rows, n_columns) key set to a non-None value
+
+    @classmethod
+    def from_feedback(cls, feedback_entries, user_of=lambda entry: entry.get("user_id")):
+        user_index = {}
+        column_index = {}
+        row_users = []
+        cells = []  # (row, column, score or None)
+
+        for row, feedback_entry in enumerate(feedback_entries):
+            row_users.append(user_index.setdefault(user_of(feedback_entry), len(user_index)))
+            for category in CATEGORIES:
+                category_map = feedback_entry.get(category)
+                if not isinstance(category_map, dict):
+                    continue
+                for key, value in category_map.items():
+                    if value is None:
+                        continue
+                    column = column_index.setdefault((category, key), len(column_index))
+                    cells.append((row, column, numeric_score(value)))
+
+        shape = (len(row_users), len(column_index))
+        values = np.zeros(shape)
+        valid = np.zeros(shape, dtype=bool)
+        present = np.zeros(shape, dtype=bool)
+        if cells:
+            rows = np.fromiter((cell[0] for cell in cells), dtype=np.intp, count=len(cells))
+            cols = np.fromiter((cell[1] for cell in cells), dtype=np.intp, count=len(cells))
+            scores = np.fromiter((np.nan if cell[2] is None else cell[2] for cell in cells), dtype=float, count=len(cells))
+            present[rows, cols] = True
+            is_valid = ~np.isnan(scores)
+            valid[rows[is_valid], cols[is_valid]] = True
+            values[rows[is_valid], cols[is_valid]] = scores[is_valid]
+
+        return cls(list(user_index), list(column_index), np.asarray(row_users, dtype=np.intp), values, valid, present)
+
+    def aggregate(self) -> "ScoreStats":
+        """Per-user, per-column statistics in one vectorized pass."""
+        n_users = len(self.users)
+        n_columns = len(self.columns)
+        if n_users == 0 or n_columns == 0:
+            empty = np.zeros((n_users, n_columns))
+            return ScoreStats(self, empty, empty.astype(np.int64), empty.astype(np.int64), empty, empty, empty, empty)
+
+        # Group rows by user so each user's rows are one contiguous slice
+        order = np.argsort(self.row_users, kind="stable")
+        starts = np.searchsorted(self.row_users[order], np.arange(n_users))
+        values = self.values[order]
+        valid = self.valid[order]
+
+        sums = np.add.reduceat(values, starts, axis=0)
+        counts = np.add.reduceat(valid, starts, axis=0, dtype=np.int64)
+        present = np.add.reduceat(self.present[order], starts, axis=0, dtype=np.int64)
+        squares = np.add.reduceat(values * values, starts, axis=0)
+        minimums = np.minimum.reduceat(np.where(valid, values, np.inf), starts, axis=0)
+        maximums = np.maximum.reduceat(np.where(valid, values, -np.inf), starts, axis=0)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(counts > 0, sums / counts, np.nan)
+            variances = np.where(counts > 0, squares / counts - means * means, np.nan)
+        stds = np.sqrt(np.clip(variances, 0.0, None))
+        minimums = np.where(counts > 0, minimums, np.nan)
+        maximums = np.where(counts > 0, maximums, np.nan)
+        return ScoreStats(self, sums, counts, present, means, minimums, maximums, stds)
+
+    def trend_slopes(self) -> np.ndarray:
+        """(users x columns) least-squares slope of score per session; NaN below two scores.
+
+        Rows must be in chronological order within each user; x is the
+        position of the session among that user's rows.
+        """
+        n_users = len(self.users)
+        if n_users == 0 or not self.columns:
+            return np.zeros((n_users, len(self.columns)))
+
+        order = np.argsort(self.row_users, kind="stable")
+        grouped_users = self.row_users[order]
+        starts = np.searchsorted(grouped_users, np.arange(n_users))
+        positions = (np.arange(len(order)) - starts[grouped_users]).astype(float)[:, None]
+        valid = self.valid[order]
+        x = np.where(valid, positions, 0.0)
+        y = self.values[order]
+
+        n = np.add.reduceat(valid, starts, axis=0, dtype=np.int64)
+        sum_x = np.add.reduceat(x, starts, axis=0)
+        sum_y = np.add.reduceat(y, starts, axis=0)
+        sum_xy = np.add.reduceat(x * y, starts, axis=0)
+        sum_xx = np.add.reduceat(x * x, starts, axis=0)
+
+        denominator = n * sum_xx - sum_x * sum_x
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slopes = (n * sum_xy - sum_x * sum_y) / denominator
+        return np.where((n >= 2) & (denominator != 0), slopes, np.nan)
+
+
+class ScoreStats:
+    """(users x columns) statistics; NaN wherever a user has no valid score."""
+
+    def __init__(self, columns: ScoreColumns, sums, counts, present, means, minimums, maximums, stds):
+        self.users = columns.users
+        self.columns = columns.columns
+        self.sums = sums
+        self.counts = counts
+        self.present = present
+        self.means = means
+        self.minimums = minimums
+        self.maximums = maximums
+        self.stds = stds
+
+    def rollup(self, user_index: int) -> dict:
+        """{category: {subcategory: {"sum", "count"}}} in the feedback_rollups format."""
+        categories = {}
+        for column in np.flatnonzero(self.present[user_index]):
+            category, key = self.columns[column]
+            categories.setdefault(category, {})[key] = {
+                "sum": float(self.sums[user_index, column]),
+                "count": int(self.counts[user_index, column]),
+            }
+        return categories
+
+    def summary(self, user_index: int) -> dict:
+        """{category: {subcategory: {"mean", "count", "min", "max", "std"}}}; None for no data."""
+
+        def value(array, column):
+            return None if np.isnan(array[user_index, column]) else float(array[user_index, column])
+
+        categories = {}
+        for column in np.flatnonzero(self.present[user_index]):
+            category, key = self.columns[column]
+            categories.setdefault(category, {})[key] = {
+                "mean": value(self.means, column),
+                "count": int(self.counts[user_index, column]),
+                "min": value(self.minimums, column),
+                "max": value(self.maximums, column),
+                "std": value(self.stds, column),
+            }
+        return categories
@@ -1,14 +1,206 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 import httpx
 import asyncio
+import json
+import importlib.util
+import os
+from contextlib import asynccontextmanager
 from cachetools import TTLCache
+from cache_backend import TwoTierCache
+import cache_events
+from warmer import CacheWarmer
+import time
 from fastapi.middleware.cors import CORSMiddleware
-import requests
+from pydantic import BaseModel, Field
+from http_cache import conditional_json, content_hash
+from firestore_db import get_db, run_db, read_stats
 
-app = FastAPI()
+# Upstream services with their own connect/read timeouts.
+# feedback-summary may call GPT-4, so it gets a much longer read timeout.
+UPSTREAMS = {
+    "summary": {
+        "url": "https://feedback-summary-101415335665.us-central1.run.app/feedback_summary/",
+        "timeout": httpx.Timeout(5.0, connect=3.0, read=30.0),
+    },
+    "previous_feedback": {
+        "url": "https://learning-points-101415335665.us-central1.run.app/learning_points/",
+        "timeout": httpx.Timeout(5.0, connect=3.0, read=10.0),
+    },
+    "tip_of_the_day": {
+        "url": "https://tip-of-day-101415335665.us-central1.run.app/tip_of_day",
+        "timeout": httpx.Timeout(5.0, connect=3.0, read=5.0),
+    },
+    "avg_scores": {
+        "url": "https://analytic-metrics-101415335665.us-central1.run.app/metrics/",
+        "timeout": httpx.Timeout(5.0, connect=3.0, read=10.0),
+    },
+    "frontend_desc": {
+        "url": "https://previous-scenario-101415335665.us-central1.run.app/get_frontend_desc/",
+        "timeout": httpx.Timeout(5.0, connect=3.0, read=10.0),
+    },
+}
 
-# Cache setup - Cache will hold data for 5 minutes (300 seconds)
-cache = TTLCache(maxsize=100, ttl=300)
+# Sections served in-process instead of over HTTP, e.g.
+# DASHBOARD_EMBEDDED_SECTIONS=previous_feedback,avg_scores,tip_of_the_day (or "all").
+# frontend_desc lives in another service and is always fetched remotely.
+_embedded_env = os.getenv("DASHBOARD_EMBEDDED_SECTIONS", "").strip()
+if _embedded_env == "all":
+    EMBEDDED_SECTIONS = {"summary", "previous_feedback", "tip_of_the_day", "avg_scores"}
+else:
+    EMBEDDED_SECTIONS = {section.strip() for section in _embedded_env.split(",") if section.strip()}
+
+if EMBEDDED_SECTIONS:
+    import embedded_sections
+    embedded_handlers = embedded_sections.load_handlers(EMBEDDED_SECTIONS)
+else:
+    embedded_handlers = {}
+
+# Invalidation events from the write paths arrive over Firestore (see cache_events.py).
+# Without credentials, /dashboard/invalidate/ still clears this instance's cache.
+INVALIDATION_ENABLED = bool(os.getenv("CRED_PATH"))
+# Long, event-invalidated TTLs (DASHBOARD_EVENT_TTLS=1) need events to reach every
+# instance, and the feedback listener (feedback_rollups.py) running somewhere
+EVENT_TTLS_ENABLED = INVALIDATION_ENABLED and os.getenv("DASHBOARD_EVENT_TTLS", "0") == "1"
+
+# Keep recently active users' sections warm in the background (see warmer.py)
+WARMER_ENABLED = os.getenv("DASHBOARD_WARMER", "1") == "1"
+# Sections older than this fraction of their TTL are refreshed ahead of time
+WARM_AT_TTL_FRACTION = 0.8
+# Warming pauses while this many live upstream fetches are in flight
+WARMER_MAX_LIVE_INFLIGHT = 20
+
+# Shared keep-alive connection pool, created and closed with the app
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+http_client: httpx.AsyncClient | None = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client
+    http_client = httpx.AsyncClient(http2=HTTP2_ENABLED, limits=HTTP_LIMITS)
+    watch = None
+    if INVALIDATION_ENABLED:
+        watch = cache_events.subscribe(get_db(), invalidate_sections, asyncio.get_running_loop())
+    rollup_watch = embedded_sections.watch_feedback(EMBEDDED_SECTIONS) if EMBEDDED_SECTIONS else None
+    warmer_task = asyncio.create_task(warmer.run()) if WARMER_ENABLED else None
+    try:
+        yield
+    finally:
+        if warmer_task is not None:
+            warmer_task.cancel()
+        if watch is not None:
+            watch.unsubscribe()
+        if rollup_watch is not None:
+            rollup_watch.unsubscribe()
+        await http_client.aclose()
+        http_client = None
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Per-section cache. Each section is served from cache while fresh, and served
+# stale (while refreshing in the background) for up to MAX_STALE_SECONDS more.
+SECTION_TTLS = {
+    "summary": 24 * 3600,  # feedback-summary regenerates weekly
+    "previous_feedback": 300,  # changes when a new session is scored
+    "tip_of_the_day": 24 * 3600,  # one tip per day, shared by all users
+    "avg_scores": 300,  # changes when a new session is scored
+    "frontend_desc": 300,
+}
+if EVENT_TTLS_ENABLED:
+    # Writes that change a section publish an invalidation event, so the TTLs
+    # only bound staleness when an event is lost
+    SECTION_TTLS.update({
+        "summary": 7 * 24 * 3600,  # invalidated by summary_regenerated / feedback_written
+        "previous_feedback": 6 * 3600,  # invalidated by feedback_written
+        "avg_scores": 6 * 3600,  # invalidated by feedback_written
+        "frontend_desc": 6 * 3600,  # invalidated by session_saved
+    })
+MAX_STALE_SECONDS = 24 * 3600
+# "No feedback found" and other 4xx answers (and a summary that does not exist
+# yet) are cached briefly and never served stale: a new user's first session
+# should show up on their next load
+MISSING_TTL_SECONDS = 30
+# In-process L1 backed by a SQLite L2 shared with the other workers on this host
+# (sized by CACHE_L1_MAX_BYTES / CACHE_L2_MAX_BYTES, L2 file at CACHE_L2_PATH)
+section_cache = TwoTierCache("dashboard")
+# When each key was last invalidated, so a fetch that started earlier does not re-cache old data
+invalidated_at = TTLCache(maxsize=10000, ttl=600)
+
+# How long a request waits for a section before returning without it. The
+# upstream fetch keeps running and fills the cache for the next request.
+SECTION_DEADLINES = {
+    "summary": 4.0,
+    "previous_feedback": 2.0,
+    "tip_of_the_day": 1.0,
+    "avg_scores": 2.0,
+    "frontend_desc": 2.0,
+}
+
+# In-flight upstream fetches by cache key, so concurrent misses share one fetch
+inflight: dict[str, asyncio.Future] = {}
+background_tasks: set[asyncio.Task] = set()
+stats = {
+    "cache_hits": 0,
+    "stale_hits": 0,
+    "cache_misses": 0,
+    "coalesced_requests": 0,
+    "refresh_errors": 0,
+    "deadline_exceeded": 0,
+    "circuit_rejections": 0,
+    "invalidations": 0,
+}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Fails fast after `threshold` consecutive upstream errors.
+
+    After `cooldown` seconds a single probe call is let through; its outcome
+    closes the breaker again or restarts the cooldown.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.time() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if not self.probing and time.time() - self.opened_at >= self.cooldown:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold:
+            self.opened_at = time.time()
+        self.probing = False
+
+
+breakers = {section: CircuitBreaker() for section in UPSTREAMS}
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,90 +210,327 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def fetch_upstream(section: str, params: dict | None = None) -> httpx.Response:
+    upstream = UPSTREAMS[section]
+    response = await http_client.get(upstream["url"], params=params, timeout=upstream["timeout"])
+    # 4xx bodies (e.g. "No feedback found") are passed through; 5xx counts as an upstream failure
+    if response.status_code >= 500:
+        response.raise_for_status()
+    return response
+
+async def fetch_section_json(section: str, params: dict | None = None):
+    # Embedded sections skip the network hop and JSON round trip entirely
+    if section in embedded_handlers:
+        return await embedded_sections.call_handler(embedded_handlers[section], params)
+    response = await fetch_upstream(section, params)
+    return response.json()
+
 async def fetch_summary(user_id:str):
-    url = "https://feedback-summary-101415335665.us-central1.run.app/feedback_summary/"
-    querystring = {"user_id":user_id}
-    response = requests.request("GET", url, params=querystring)
-    response=response.json()
+    response = await fetch_section_json("summary", {"user_id": user_id})
     return response.get('summary')
 
 async def fetch_previous_feedback(user_id):
-    url = "https://learning-points-101415335665.us-central1.run.app/learning_points/"
-    querystring = {"user_id":user_id}
-    response = requests.request("GET", url, params=querystring)
-    response=response.json()
+    response = await fetch_section_json("previous_feedback", {"user_id": user_id})
     return response
 
 async def fetch_tip_of_the_day():
-    url = "https://tip-of-day-101415335665.us-central1.run.app/tip_of_day"
-    response = requests.request("GET", url)
-    response=response.json()
+    response = await fetch_section_json("tip_of_the_day")
     return response
 
 async def fetch_avg_scores(user_id:str):
-    url = "https://analytic-metrics-101415335665.us-central1.run.app/metrics/"
-    querystring = {"user_id":user_id}
-    response = requests.request("GET", url, params=querystring)
-    response=response.json()
+    response = await fetch_section_json("avg_scores", {"user_id": user_id})
     return response
 
 async def fetch_frontend_desc(user_id: str):
-    url = "https://previous-scenario-101415335665.us-central1.run.app/get_frontend_desc/"
-    querystring = {"user_id": user_id}
+    response = await fetch_upstream("frontend_desc", {"user_id": user_id})
+    try:
+        response.raise_for_status()
+        data = response.json()
+        return data.get('frontend_desc')
+    except httpx.HTTPStatusError as e:
+        print(f"HTTP error occurred: {e.response.status_code} - {e.response.text}")
+        return FRONTEND_DESC_NOT_FOUND
+
+FRONTEND_DESC_NOT_FOUND = {'frontend_desc': 'Not found'}
+
+def is_missing(value) -> bool:
+    """Whether a section value stands for "nothing there (yet)" rather than data."""
+    return value is None or value == FRONTEND_DESC_NOT_FOUND or (isinstance(value, dict) and set(value) == {"detail"})
 
-    async with httpx.AsyncClient() as client:
+# Dashboard sections and the fetcher behind each; global sections share one cache entry
+SECTIONS = {
+    "summary": {"fetch": fetch_summary, "per_user": True},
+    "previous_feedback": {"fetch": fetch_previous_feedback, "per_user": True},
+    "tip_of_the_day": {"fetch": fetch_tip_of_the_day, "per_user": False},
+    "avg_scores": {"fetch": fetch_avg_scores, "per_user": True},
+    "frontend_desc": {"fetch": fetch_frontend_desc, "per_user": True},
+}
+
+def section_key(section: str, user_id: str) -> str:
+    return f"{section}_{user_id}" if SECTIONS[section]["per_user"] else section
+
+async def single_flight(key: str, fetch):
+    """Run fetch() once per key; concurrent callers await the same result."""
+    future = inflight.get(key)
+    if future is not None:
+        stats["coalesced_requests"] += 1
+    else:
+        future = asyncio.ensure_future(fetch())
+        inflight[key] = future
+        future.add_done_callback(lambda _: inflight.pop(key, None))
+    # Shield so a disconnecting client does not cancel the fetch for everyone else
+    return await asyncio.shield(future)
+
+async def refresh_section(section: str, user_id: str):
+    key = section_key(section, user_id)
+
+    async def fetch():
+        spec = SECTIONS[section]
+        breaker = breakers[section]
+        started_at = time.time()
+        if not breaker.allow():
+            stats["circuit_rejections"] += 1
+            raise CircuitOpenError(f"{section} upstream circuit is open")
         try:
-            response = await client.get(url, params=querystring)
-            response.raise_for_status()
-            data = response.json()
-            return data.get('frontend_desc')
-        except httpx.HTTPStatusError as e:
-            print(f"HTTP error occurred: {e.response.status_code} - {e.response.text}")
-            return {'frontend_desc': 'Not found'}
-        except Exception as e:
-            print(f"An error occurred: {str(e)}")
-            return 
+            value = await (spec["fetch"](user_id) if spec["per_user"] else spec["fetch"]())
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        entry = {"value": value, "fetched_at": time.time(), "etag": content_hash(value), "missing": is_missing(value)}
+        if invalidated_at.get(key, 0) <= started_at:
+            await section_cache.set(key, entry)
+        return entry
 
-async def fetch_all_data(user_id):
-    summary_task = fetch_summary(user_id)
-    feedback_task = fetch_previous_feedback(user_id)
-    tip_task = fetch_tip_of_the_day()
-    avg_scores_task = fetch_avg_scores(user_id)
-    frontend_desc_task = fetch_frontend_desc(user_id)
-
-    summary, feedback, tip, avg_scores, frontend_desc = await asyncio.gather(
-        summary_task, feedback_task, tip_task, avg_scores_task, frontend_desc_task
-    )
+    return await single_flight(key, fetch)
 
-    result = {
-        "summary": summary,
-        "previous_feedback": feedback,
-        "tip_of_the_day": tip,
-        "avg_scores": avg_scores,
-        "frontend_desc": frontend_desc
-    }
-    return result
+def _background_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if task.cancelled() or task.exception() is None:
+        return
+    if not isinstance(task.exception(), CircuitOpenError):
+        stats["refresh_errors"] += 1
+        print(f"Background refresh failed: {task.exception()}")
+
+def refresh_in_background(section: str, user_id: str):
+    if section_key(section, user_id) in inflight:
+        return
+    task = asyncio.create_task(refresh_section(section, user_id))
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+
+async def invalidate_sections(user_id: str, sections: list[str]):
+    keys = [section_key(section, user_id) for section in sections if section in SECTIONS]
+    now = time.time()
+    for key in keys:
+        invalidated_at[key] = now
+    await section_cache.delete(*keys)
+    stats["invalidations"] += 1
+    # A write means the user just finished a session; their next load is likely soon
+    warmer.touch(user_id)
+
+def entry_ttl(section: str, entry: dict) -> float:
+    return MISSING_TTL_SECONDS if entry.get("missing") else SECTION_TTLS[section]
+
+async def sections_due_for_refresh(user_id: str) -> list[str]:
+    due = []
+    for section in SECTIONS:
+        key = section_key(section, user_id)
+        if key in inflight:
+            continue
+        entry = await section_cache.get(key, record_stats=False)
+        if entry is not None and entry.get("missing"):
+            # Nothing there yet (e.g. a user without feedback); live requests re-check it
+            continue
+        if entry is None or time.time() - entry["fetched_at"] > WARM_AT_TTL_FRACTION * SECTION_TTLS[section]:
+            due.append(section)
+    return due
+
+warmer = CacheWarmer(
+    refresh=refresh_section,
+    sections_due=sections_due_for_refresh,
+    is_busy=lambda: len(inflight) >= WARMER_MAX_LIVE_INFLIGHT,
+)
+
+async def get_section(section: str, user_id: str):
+    """Return (value, status, etag) for one section, never raising.
+
+    status is "ok", "stale", or why the section is missing: "timeout",
+    "circuit_open" or "error".
+    """
+    entry = await section_cache.get(section_key(section, user_id))
+    if entry is not None:
+        age = time.time() - entry["fetched_at"]
+        if age < entry_ttl(section, entry):
+            stats["cache_hits"] += 1
+            return entry["value"], "ok", entry["etag"]
+        if not entry.get("missing") and age < SECTION_TTLS[section] + MAX_STALE_SECONDS:
+            # Serve stale right away and refresh for the next request
+            stats["stale_hits"] += 1
+            refresh_in_background(section, user_id)
+            return entry["value"], "stale", entry["etag"]
+    stats["cache_misses"] += 1
 
-@app.get("/dashboard/")
-async def get_dashboard(user_id: str):
-    # Use user_id as part of the cache key
-    cache_key = f"dashboard_data_{user_id}"
-    
-    # Check if the result for this specific user is cached
-    if cache_key in cache:
-        return cache[cache_key]
-
-    # Fetch all data asynchronously
     try:
-        data = await fetch_all_data(user_id)
+        fresh = await asyncio.wait_for(refresh_section(section, user_id), SECTION_DEADLINES[section])
+        return fresh["value"], "ok", fresh["etag"]
+    except asyncio.TimeoutError:
+        stats["deadline_exceeded"] += 1
+        status = "timeout"
+    except CircuitOpenError:
+        status = "circuit_open"
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching data: {str(e)}")
+        print(f"Error fetching {section} for {user_id}: {str(e)}")
+        status = "error"
+
+    # Anything is better than nothing, even an entry past its stale window
+    if entry is not None:
+        return entry["value"], "stale", entry["etag"]
+    return None, status, content_hash(None)
 
-    # Cache the result for this specific user
-    cache[cache_key] = data
+async def resolve_sections(user_id: str):
+    results = await asyncio.gather(*(get_section(section, user_id) for section in SECTIONS))
+    return dict(zip(SECTIONS, results))
 
+def assemble_dashboard(results: dict) -> dict:
+    data = {section: value for section, (value, _, _) in results.items()}
+    data["status"] = {section: status for section, (_, status, _) in results.items()}
     return data
 
+async def fetch_all_data(user_id):
+    return assemble_dashboard(await resolve_sections(user_id))
+
+@app.get("/dashboard/")
+async def get_dashboard(user_id: str, request: Request):
+    warmer.touch(user_id)
+    # Fetch all sections, each from its own cache entry when possible
+    results = await resolve_sections(user_id)
+    data = assemble_dashboard(results)
+    if not any(status in ("ok", "stale") for status in data["status"].values()):
+        raise HTTPException(status_code=502, detail=f"Error fetching data: {data['status']}")
+
+    # The ETag is built from the per-section hashes stored with each cache
+    # entry, so a repeat load is answered without re-serializing the payload.
+    # The status map is left out: a weak ETag only promises equivalent content.
+    etag = f'W/"{content_hash([section_etag for _, _, section_etag in results.values()])}"'
+
+    # Per-user data: only the browser may cache it, and it must revalidate each time
+    return conditional_json(request, data, "private, no-cache", etag=etag)
+
+def encode_stream_event(event: str, payload: dict, format: str) -> str:
+    data = json.dumps(payload, default=str)
+    if format == "sse":
+        return f"event: {event}\ndata: {data}\n\n"
+    return data + "\n"
+
+@app.get("/dashboard/stream/")
+async def stream_dashboard(
+    user_id: str,
+    format: str = Query("sse", pattern="^(sse|ndjson)$", description="'sse' or 'ndjson'")
+):
+    """Emit each dashboard section as soon as it resolves, then a final "done" event."""
+    warmer.touch(user_id)
+
+    async def section_event(section: str):
+        value, status, _ = await get_section(section, user_id)
+        return section, value, status
+
+    async def events():
+        tasks = [asyncio.create_task(section_event(section)) for section in SECTIONS]
+        statuses = {}
+        try:
+            # Cache hits finish on their first step; send them together in the first chunk
+            await asyncio.sleep(0)
+            first_chunk = []
+            for task in [task for task in tasks if task.done()]:
+                section, value, status = task.result()
+                statuses[section] = status
+                first_chunk.append(encode_stream_event("section", {"section": section, "status": status, "data": value}, format))
+            if first_chunk:
+                yield "".join(first_chunk)
+
+            for next_done in asyncio.as_completed([task for task in tasks if not task.done()]):
+                section, value, status = await next_done
+                statuses[section] = status
+                yield encode_stream_event("section", {"section": section, "status": status, "data": value}, format)
+
+            yield encode_stream_event("done", {"status": statuses}, format)
+        finally:
+            # Client went away: stop waiting (upstream fetches are shielded and still fill the cache)
+            for task in tasks:
+                task.cancel()
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        events(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Team views: at most this many dashboards are built concurrently per batch
+BATCH_CONCURRENCY = 10
+MAX_BATCH_SIZE = 100
+
+
+class DashboardBatchRequest(BaseModel):
+    user_ids: list[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+@app.post("/dashboard/batch/")
+async def get_dashboard_batch(request: DashboardBatchRequest):
+    # Duplicate ids share one dashboard; global sections like the tip are
+    # cached once and concurrent misses on them coalesce in single_flight.
+    user_ids = list(dict.fromkeys(request.user_ids))
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def build(user_id: str):
+        async with semaphore:
+            return await fetch_all_data(user_id)
+
+    dashboards = await asyncio.gather(*(build(user_id) for user_id in user_ids))
+    return {"dashboards": dict(zip(user_ids, dashboards))}
+
+class InvalidationRequest(BaseModel):
+    user_id: str
+    event: str = Field(..., description="One of: " + ", ".join(cache_events.EVENT_SECTIONS))
+
+
+@app.post("/dashboard/invalidate/")
+async def invalidate_dashboard(request: InvalidationRequest):
+    """Publish a write event for services that cannot reach Firestore directly."""
+    sections = cache_events.EVENT_SECTIONS.get(request.event)
+    if sections is None:
+        raise HTTPException(status_code=400, detail=f"Unknown event: {request.event}")
+
+    await invalidate_sections(request.user_id, sections)
+    if INVALIDATION_ENABLED:
+        # Other instances pick this up through their listeners
+        await run_db(cache_events.publish_invalidation, get_db(), request.user_id, request.event, "dashboard")
+
+    return {"message": "Cache invalidated", "user_id": request.user_id, "sections": sections}
+
+class ActivityRequest(BaseModel):
+    user_id: str
+
+
+@app.post("/dashboard/activity/")
+async def record_activity(request: ActivityRequest):
+    """Mark a user as active (e.g. on login) so the warmer prepares their dashboard."""
+    warmer.touch(request.user_id)
+    return {"message": "Activity recorded", "user_id": request.user_id}
+
+@app.get("/dashboard/stats")
+async def get_dashboard_stats():
+    return {
+        **stats,
+        "inflight": len(inflight),
+        "background_refreshes": len(background_tasks),
+        "cache": section_cache.snapshot_stats(),
+        "warmer": warmer.snapshot_stats(),
+        "breakers": {section: breaker.state for section, breaker in breakers.items()},
+        "firestore_reads": dict(read_stats),
+    }
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
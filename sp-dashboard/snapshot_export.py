@@ -0,0 +1,284 @@
+"""Columnar snapshots of feedback and session data for offline analytics.
+
+Exports the Firestore `feedback` collection and the Supabase `transcription`
+and `improvement_feedback` tables to Arrow IPC files, partitioned by the
+day each record was written:
+
+    $SNAPSHOT_ROOT/<dataset>/date=YYYY-MM-DD/part-<run>.arrow
+    $SNAPSHOT_ROOT/<dataset>/_watermark.json
+
+Each run only exports records not yet exported, appending new part files,
+so it can run on a schedule. The watermark holds the newest exported
+timestamp and the ids exported at exactly that time, so records that share
+it but arrive later are still picked up:
+
+    python snapshot_export.py export [--dataset feedback]
+
+Analysts read the files with read_dataset(), which memory-maps them instead
+of querying the live databases:
+
+    from snapshot_export import read_dataset
+    table = read_dataset("feedback", start="2025-03-01")
+    table.to_pandas().groupby("user_id")["sales_and_persuasion.objection_handling"].mean()
+
+Feedback category maps become one float64 column per "<category>.<subcategory>"
+(non-numeric scores are null). The free-text feedback list is kept as a
+JSON string column.
+"""
+import argparse
+import json
+import os
+from datetime import date, datetime, timezone
+from pathlib import Path
+import pyarrow as pa
+from score_columns import CATEGORIES, numeric_score
+
+SNAPSHOT_ROOT = Path(os.getenv("SNAPSHOT_ROOT", "snapshots"))
+
+# Rows buffered before a part file is written; a file is also written whenever the date changes
+ROWS_PER_FILE = 50_000
+SUPABASE_PAGE_SIZE = 1000
+
+FIXED_COLUMNS = {
+    "feedback": pa.schema([
+        ("id", pa.string()),
+        ("user_id", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("roleplay_type", pa.string()),
+        ("feedback", pa.string()),
+    ]),
+    "transcription": pa.schema([
+        ("id", pa.string()),
+        ("user_id", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("type", pa.string()),
+        ("call_duration", pa.string()),
+        ("frontend_desc", pa.string()),
+        ("transcript", pa.string()),
+    ]),
+    "improvement_feedback": pa.schema([
+        ("id", pa.string()),
+        ("user_id", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("communication_and_delivery", pa.int64()),
+        ("customer_interaction_and_resolution", pa.int64()),
+        ("sales_and_persuasion", pa.int64()),
+        ("professionalism_and_presentation", pa.int64()),
+        ("overall_confidence", pa.int64()),
+        ("rank", pa.int64()),
+    ]),
+}
+
+
+def _utc(value) -> datetime | None:
+    """Firestore timestamps and the ISO strings stored in Supabase, as aware UTC datetimes."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _text(value) -> str | None:
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, default=str)
+
+
+def _int(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def feedback_row(doc_id: str, data: dict) -> dict:
+    row = {
+        "id": doc_id,
+        "user_id": data.get("user_id"),
+        "timestamp": _utc(data.get("timestamp")),
+        "roleplay_type": data.get("roleplay_type") or data.get("type"),
+        "feedback": _text(data.get("feedback")),
+    }
+    for category in CATEGORIES:
+        category_map = data.get(category)
+        if isinstance(category_map, dict):
+            for key, value in category_map.items():
+                row[f"{category}.{key}"] = numeric_score(value)
+    return row
+
+
+def transcription_row(row: dict) -> dict:
+    data = row.get("transcription_data") or {}
+    return {
+        "id": row.get("transcription_id"),
+        "user_id": data.get("user_id"),
+        "timestamp": _utc(data.get("timestamp")),
+        "type": data.get("type"),
+        "call_duration": _text(data.get("call_duration")),
+        "frontend_desc": _text(data.get("frontend_desc")),
+        "transcript": _text(data.get("transcript")),
+    }
+
+
+def improvement_feedback_row(row: dict) -> dict:
+    data = row.get("feedback_data") or {}
+    result = {
+        "id": _text(row.get("id")),
+        "user_id": data.get("user_id"),
+        "timestamp": _utc(data.get("created_at")),
+    }
+    for column in FIXED_COLUMNS["improvement_feedback"].names[3:]:
+        result[column] = _int(data.get(column))
+    return result
+
+
+def read_firestore_feedback(since: datetime | None):
+    from firestore_db import get_db
+
+    query = get_db().collection("feedback")
+    if since is not None:
+        query = query.where("timestamp", ">=", since)
+    for doc in query.order_by("timestamp").stream():
+        yield feedback_row(doc.id, doc.to_dict())
+
+
+def _read_supabase(table: str, data_column: str, time_field: str, to_row, since: datetime | None):
+    from supabase import create_client
+
+    client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    time_path = f"{data_column}->>{time_field}"
+    start = 0
+    while True:
+        query = client.table(table).select("*")
+        if since is not None:
+            # ISO-8601 strings in one format compare in time order
+            query = query.gte(time_path, since.replace(tzinfo=None).isoformat())
+        response = query.order(time_path).range(start, start + SUPABASE_PAGE_SIZE - 1).execute()
+        for row in response.data:
+            yield to_row(row)
+        if len(response.data) < SUPABASE_PAGE_SIZE:
+            return
+        start += SUPABASE_PAGE_SIZE
+
+
+# dataset -> reader(since) yielding rows at or after `since`, in timestamp order
+SOURCES = {
+    "feedback": read_firestore_feedback,
+    "transcription": lambda since: _read_supabase(
+        "transcription", "transcription_data", "timestamp", transcription_row, since
+    ),
+    "improvement_feedback": lambda since: _read_supabase(
+        "improvement_feedback", "feedback_data", "created_at", improvement_feedback_row, since
+    ),
+}
+
+
+def _watermark_path(root: Path, dataset: str) -> Path:
+    return root / dataset / "_watermark.json"
+
+
+def load_watermark(root: Path, dataset: str) -> tuple[datetime | None, set]:
+    """(newest exported timestamp, ids exported at exactly that timestamp)."""
+    path = _watermark_path(root, dataset)
+    if not path.exists():
+        return None, set()
+    watermark = json.loads(path.read_text())
+    return _utc(watermark["timestamp"]), set(watermark.get("ids", []))
+
+
+def _save_watermark(root: Path, dataset: str, timestamp: datetime, ids: set):
+    path = _watermark_path(root, dataset)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"timestamp": timestamp.isoformat(), "ids": sorted(ids, key=str)}))
+    tmp.replace(path)
+
+
+def _table(dataset: str, rows: list) -> pa.Table:
+    fixed = FIXED_COLUMNS[dataset]
+    # Category score columns vary between documents; add them as float64 in a stable order
+    extra = sorted({key for row in rows for key in row} - set(fixed.names))
+    schema = pa.schema(list(fixed) + [(name, pa.float64()) for name in extra])
+    return pa.Table.from_pylist(rows, schema=schema)
+
+
+def _write_part(root: Path, dataset: str, day: str, run_id: str, part: int, rows: list):
+    directory = root / dataset / f"date={day}"
+    directory.mkdir(parents=True, exist_ok=True)
+    table = _table(dataset, rows)
+    path = directory / f"part-{run_id}-{part:04d}.arrow"
+    tmp = path.with_suffix(".tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    tmp.replace(path)
+
+
+def export_dataset(dataset: str, root: Path = SNAPSHOT_ROOT) -> int:
+    """Append every record not covered by the watermark; returns the number exported."""
+    since, since_ids = load_watermark(root, dataset)
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    day, rows = None, []
+    parts = 0
+    exported = 0
+    newest, newest_ids = since, set(since_ids)
+
+    for row in SOURCES[dataset](since):
+        if row["timestamp"] is None or (row["timestamp"] == since and row["id"] in since_ids):
+            continue
+        row_day = row["timestamp"].date().isoformat()
+        # Rows arrive in timestamp order, so only the current day is buffered
+        if rows and (row_day != day or len(rows) >= ROWS_PER_FILE):
+            _write_part(root, dataset, day, run_id, parts, rows)
+            parts += 1
+            rows = []
+        day = row_day
+        rows.append(row)
+        if newest is None or row["timestamp"] > newest:
+            newest, newest_ids = row["timestamp"], set()
+        if row["timestamp"] == newest:
+            newest_ids.add(row["id"])
+        exported += 1
+
+    if rows:
+        _write_part(root, dataset, day, run_id, parts, rows)
+
+    # Only advanced once every part file is in place, so a failed run is simply retried
+    if exported:
+        _save_watermark(root, dataset, newest, newest_ids)
+    return exported
+
+
+def read_dataset(dataset: str, start: str | date | None = None, end: str | date | None = None,
+                 columns: list | None = None, root: Path = SNAPSHOT_ROOT) -> pa.Table:
+    """Memory-map the dataset's part files for dates in [start, end] into one table."""
+    start = start.isoformat() if isinstance(start, date) else start
+    end = end.isoformat() if isinstance(end, date) else end
+    tables = []
+    for directory in sorted((root / dataset).glob("date=*")):
+        day = directory.name.split("=", 1)[1]
+        if (start and day < start) or (end and day > end):
+            continue
+        for path in sorted(directory.glob("*.arrow")):
+            table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+            if columns is not None:
+                table = table.select([name for name in columns if name in table.column_names])
+            tables.append(table)
+    if not tables:
+        return FIXED_COLUMNS[dataset].empty_table()
+    # Part files may have different category columns; missing ones become nulls
+    return pa.concat_tables(tables, promote_options="default")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar snapshots of feedback and session data")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Append records not yet exported for each dataset")
+    export_parser.add_argument("--dataset", choices=sorted(SOURCES), action="append",
+                               help="Only export this dataset (repeatable)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        for name in args.dataset or SOURCES:
+            print(f"Exported {export_dataset(name)} {name} records to {SNAPSHOT_ROOT / name}")
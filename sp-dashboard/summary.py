@@ -1,17 +1,45 @@
 from fastapi import FastAPI, HTTPException, Query
-import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import firestore
+from firestore_db import get_db, run_db, project, field_paths, counted, counted_doc, measure_reads
+import cache_events
+from cache_events import publish_invalidation
+from feedback_rollups import LATEST_COLLECTION
+from http_cache import content_hash
+from llm_client import LLM_MAX_CONCURRENCY, llm
+from summary_queue import SummaryQueue
 import openai
 from google.api_core.exceptions import GoogleAPICallError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+import asyncio
+from contextlib import asynccontextmanager
 import os
 import json
+import uuid
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 load_dotenv()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watch = None
+    worker_task = None
+    if SUMMARY_WORKER_ENABLED:
+        # Summary sections are also invalidated by summary_regenerated, which must not queue a rebuild
+        watch = cache_events.subscribe(db, enqueue_summary, asyncio.get_running_loop(), events=["feedback_written"])
+        worker_task = asyncio.create_task(precompute_queue.run())
+    try:
+        yield
+    finally:
+        if worker_task is not None:
+            worker_task.cancel()
+        if watch is not None:
+            watch.unsubscribe()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,18 +48,51 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+measure_reads(app)
 
 # Initialize Firebase
-cred = credentials.Certificate(os.getenv("CRED_PATH"))
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+db = get_db()
 
 # OpenAI API Key
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# Summaries are stored under a hash of their prompt input (summary_cache/{hash}) and
+# reused for any user with the same input. Bump the version when the prompt or model changes.
+SUMMARY_CACHE_COLLECTION = "summary_cache"
+SUMMARY_PROMPT_VERSION = "gpt-4/v1"
+
+# summary_points written before input hashes are trusted for this long, as before
+LEGACY_SUMMARY_MAX_AGE = timedelta(days=7)
+# The latest_feedback pointer shortcut is only taken for summaries checked against the
+# feedback itself within this long, so a pointer that stopped moving cannot pin a summary
+SUMMARY_SHORTCUT_MAX_AGE = timedelta(days=7)
+
+# Precompute summaries in the background when feedback lands (see summary_queue.py).
+# Every instance receives each feedback_written event and queues the job, so the
+# worker needs the lease below to keep that to a single LLM call.
+SUMMARY_WORKER_ENABLED = os.getenv("SUMMARY_WORKER", "1") != "0"
+
+# Cross-instance lease (summary_leases/{user_id}): while one instance generates a
+# user's summary, the others wait for its result instead of calling the LLM as well.
+# Keep it above the worst-case generation time. 0 disables it, which is only safe
+# for a single instance; it defaults to on whenever the worker runs.
+SUMMARY_LEASE_SECONDS = float(os.getenv("SUMMARY_LEASE_SECONDS", "180" if SUMMARY_WORKER_ENABLED else "0"))
+if SUMMARY_WORKER_ENABLED and SUMMARY_LEASE_SECONDS <= 0:
+    print("SUMMARY_WORKER is on without a lease: every instance will generate each summary itself")
+SUMMARY_LEASE_POLL_SECONDS = 1.0
+SUMMARY_LEASE_COLLECTION = "summary_leases"
+INSTANCE_ID = uuid.uuid4().hex
+
+SUMMARY_JOBS_PER_MINUTE = float(os.getenv("SUMMARY_JOBS_PER_MINUTE", "20"))
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "5"))
+
+# user_id -> the generation in progress in this process
+summary_inflight: dict[str, asyncio.Future] = {}
+summary_stats = {"coalesced_requests": 0, "lease_waits": 0}
+
 # LLM Prompt for Feedback Summary
-def generate_feedback_summary(feedback_list):
-    prompt = (
+def summary_prompt(feedback_list):
+    return (
         "Here is a collection of feedback from a user's sales conversation:\n\n"
         + "\n".join(f"- {f['short_feedback']}: {f['long_feedback']}" for f in feedback_list)
         + """
@@ -49,69 +110,356 @@ def generate_feedback_summary(feedback_list):
         """
     )
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{"role": "system", "content": "You are an AI assistant skilled in analyzing sales feedback."},
-                  {"role": "user", "content": prompt}],
-        temperature=0.7,
-    )
+def summary_messages(feedback_list):
+    return [{"role": "system", "content": "You are an AI assistant skilled in analyzing sales feedback."},
+            {"role": "user", "content": summary_prompt(feedback_list)}]
 
-    return response["choices"][0]["message"]["content"]
+async def generate_feedback_summary(feedback_list):
+    # Async and concurrency-limited, so other requests keep flowing during the GPT-4 call
+    return await llm.chat(model="gpt-4", messages=summary_messages(feedback_list), temperature=0.7)
 
-@app.get("/feedback_summary/")
-async def get_feedback_summary(user_id: str):
+TIP_KEYS = ("positive_tips", "improvement_tips")
+
+class TipStreamParser:
+    """Picks complete tips out of the summary JSON while it is still being generated.
+
+    feed() takes the next chunk of model output and returns [(tip key, tip)] for
+    every string that finished inside a positive_tips/improvement_tips array.
+    Text outside JSON strings (e.g. a ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self.in_string = False
+        self.escaped = False
+        self.chars = []
+        self.last_string = None
+        self.key = None
+        # One entry per open container: "{" or the key of an open array
+        self.stack = []
+
+    def feed(self, text: str) -> list:
+        tips = []
+        for char in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    value = json.loads('"' + "".join(self.chars) + '"')
+                    if self.stack and self.stack[-1] in TIP_KEYS:
+                        tips.append((self.stack[-1], value))
+                    else:
+                        self.last_string = value
+                    continue
+                self.chars.append(char)
+            elif char == '"':
+                self.in_string = True
+                self.chars = []
+            elif char == ":":
+                self.key = self.last_string
+            elif char == "{":
+                self.stack.append("{")
+            elif char == "[":
+                self.stack.append(self.key or "[")
+                self.key = None
+            elif char in "}]" and self.stack:
+                self.stack.pop()
+        return tips
+
+def summary_tips(result: dict) -> list:
+    """[(tip key, tip)] of a {"summary": ...} response."""
+    body = result.get("summary")
+    if isinstance(body, dict):
+        body = body.get("summary", body)
+    if not isinstance(body, dict):
+        return []
+    return [(kind, tip) for kind in TIP_KEYS for tip in body.get(kind, [])]
+
+async def stream_feedback_summary(feedback_list, on_tip):
+    """generate_feedback_summary, calling on_tip(key, tip) as each tip completes."""
+    parser = TipStreamParser()
+    chunks = []
+    async for delta in llm.stream_chat(model="gpt-4", messages=summary_messages(feedback_list), temperature=0.7):
+        chunks.append(delta)
+        for kind, tip in parser.feed(delta):
+            on_tip(kind, tip)
+    return "".join(chunks)
+
+def feedback_timestamps(feedback_ref, user_id: str):
+    """[(document id, {"timestamp": ...})] for every feedback document of the user."""
+    query = project(feedback_ref.where("user_id", "==", user_id), ["timestamp"])
+    return [(doc.id, doc.to_dict()) for doc in counted(query.stream())]
+
+def recent_feedback(user_id: str):
+    """(id of the newest feedback document, feedback items of the 5 newest) for the prompt."""
+    feedback_ref = db.collection("feedback")
+    results = feedback_timestamps(feedback_ref, user_id)
+
+    if not results:
+        raise HTTPException(status_code=404, detail="No feedback found for the given user_id")
+
+    # Sort results by timestamp in descending order and download the 5 most recent entries
+    recent_ids = [doc_id for doc_id, _ in sorted(results, key=lambda x: x[1].get('timestamp', 0), reverse=True)[:5]]
+    recent_docs = {
+        doc.id: doc.to_dict()
+        for doc in counted(db.get_all([feedback_ref.document(doc_id) for doc_id in recent_ids], field_paths=field_paths(["feedback"])))
+        if doc.exists
+    }
+    sorted_results = [recent_docs[doc_id] for doc_id in recent_ids if doc_id in recent_docs]
+
+    # Collect feedback data from the 5 most recent entries
+    all_feedback = []
+    for feedback_entry in sorted_results:
+        if "feedback" in feedback_entry:
+            all_feedback.extend(feedback_entry["feedback"])
+
+    if not all_feedback:
+        raise HTTPException(status_code=404, detail="No valid feedback found for the given user_id")
+
+    return recent_ids[0], all_feedback
+
+def summary_input_hash(feedback_list) -> str:
+    """Hash of exactly what goes into the prompt, so equal inputs share one summary."""
+    return content_hash({
+        "prompt": SUMMARY_PROMPT_VERSION,
+        "feedback": [[f.get("short_feedback"), f.get("long_feedback")] for f in feedback_list],
+    })
+
+def _age(value) -> timedelta:
+    return datetime.now() - datetime.fromtimestamp(value.timestamp())
+
+def summary_inputs(user_id: str):
+    """(summary, None) if a stored summary matches the user's current feedback,
+    else (None, job) where job has the prompt's feedback items and its input hash."""
+    summary_ref = db.collection("summary_points").document(user_id)
+    existing_summary_doc = counted_doc(summary_ref.get())
+    existing_summary = existing_summary_doc.to_dict() if existing_summary_doc.exists else None
+
+    # Shortcut: if the newest feedback document hasn't changed, neither has the prompt input
+    checked_at = existing_summary and (existing_summary.get("verified_at") or existing_summary.get("timestamp"))
+    if existing_summary and existing_summary.get("latest_feedback_id") and checked_at and _age(checked_at) < SUMMARY_SHORTCUT_MAX_AGE:
+        latest_doc = counted_doc(db.collection(LATEST_COLLECTION).document(user_id).get(field_paths=["feedback_id"]))
+        if latest_doc.exists and latest_doc.to_dict().get("feedback_id") == existing_summary["latest_feedback_id"]:
+            return existing_summary["summary"], None
+
+    latest_feedback_id, all_feedback = recent_feedback(user_id)
+    inputs = {"input_hash": summary_input_hash(all_feedback), "latest_feedback_id": latest_feedback_id}
+
+    if existing_summary:
+        if existing_summary.get("input_hash") == inputs["input_hash"]:
+            # Still current; the shortcut may be taken again for another SUMMARY_SHORTCUT_MAX_AGE
+            summary_ref.update({**inputs, "verified_at": datetime.now()})
+            return existing_summary["summary"], None
+        # Summaries written before input hashes are adopted for the current inputs while recent
+        summary_date = existing_summary.get("timestamp")
+        if (
+            "input_hash" not in existing_summary
+            and summary_date
+            and _age(summary_date) < LEGACY_SUMMARY_MAX_AGE
+        ):
+            summary_ref.update(inputs)
+            return existing_summary["summary"], None
+
+    # Another user (or this one, earlier) already had exactly these inputs
+    cached_doc = counted_doc(db.collection(SUMMARY_CACHE_COLLECTION).document(inputs["input_hash"]).get())
+    if cached_doc.exists:
+        summary = cached_doc.to_dict()["summary"]
+        save_summary(user_id, summary, inputs)
+        return summary, None
+
+    return None, {"feedback": all_feedback, **inputs}
+
+def save_summary(user_id: str, summary, inputs: dict):
+    # Save summary to Firestore, and to the shared cache under its input hash
+    now = datetime.now()
+    db.collection("summary_points").document(user_id).set({
+        "summary": summary,
+        "timestamp": now,
+        **inputs,
+    })
+    db.collection(SUMMARY_CACHE_COLLECTION).document(inputs["input_hash"]).set({"summary": summary, "timestamp": now})
     try:
-        feedback_ref = db.collection("feedback")
-        summary_ref = db.collection("summary_points")
-
-        # Check if a summary already exists
-        existing_summary_doc = summary_ref.document(user_id).get()
-        if existing_summary_doc.exists:
-            existing_summary = existing_summary_doc.to_dict()
-            summary_date = existing_summary.get("timestamp")
-            if summary_date and datetime.now() - datetime.fromtimestamp(summary_date.timestamp()) < timedelta(days=7):
-                return {"summary": existing_summary["summary"]}
-            else:
-                # If the summary is older than 7 days, fetch feedback for an updated summary
-                query = feedback_ref.where("user_id", "==", user_id)
-                results = [doc.to_dict() for doc in query.stream()]
-        else:
-            # If no summary exists, fetch feedback to generate a new one
-            query = feedback_ref.where("user_id", "==", user_id)
-            results = [doc.to_dict() for doc in query.stream()]
+        publish_invalidation(db, user_id, "summary_regenerated", "feedback-summary")
+    except GoogleAPICallError as e:
+        print(f"Failed to publish summary invalidation: {str(e)}")
 
-        if not results:
-            raise HTTPException(status_code=404, detail="No feedback found for the given user_id")
+@firestore.transactional
+def _take_lease(transaction, lease_ref, seconds: float):
+    lease_doc = lease_ref.get(transaction=transaction)
+    now = datetime.now(timezone.utc)
+    if lease_doc.exists:
+        lease = lease_doc.to_dict()
+        if lease.get("owner") != INSTANCE_ID and lease["expires_at"] > now:
+            return False
+    transaction.set(lease_ref, {"owner": INSTANCE_ID, "expires_at": now + timedelta(seconds=seconds)})
+    return True
 
-        # Sort results by timestamp in descending order and get the 5 most recent entries
-        sorted_results = sorted(results, key=lambda x: x.get('timestamp', 0), reverse=True)[:5]
+def acquire_lease(user_id: str) -> bool:
+    lease_ref = db.collection(SUMMARY_LEASE_COLLECTION).document(user_id)
+    return _take_lease(db.transaction(), lease_ref, SUMMARY_LEASE_SECONDS)
 
-        # Collect feedback data from the 5 most recent entries
-        all_feedback = []
-        for feedback_entry in sorted_results:
-            if "feedback" in feedback_entry:
-                all_feedback.extend(feedback_entry["feedback"])
+def release_lease(user_id: str):
+    # Not transactional: at worst an expired lease taken over by another instance is dropped early
+    lease_ref = db.collection(SUMMARY_LEASE_COLLECTION).document(user_id)
+    lease_doc = lease_ref.get()
+    if lease_doc.exists and lease_doc.to_dict().get("owner") == INSTANCE_ID:
+        lease_ref.delete()
 
-        if not all_feedback:
-            raise HTTPException(status_code=404, detail="No valid feedback found for the given user_id")
+def stored_summary_for(user_id: str, input_hash: str):
+    """The stored summary if it was generated from `input_hash`, else None."""
+    summary_doc = counted_doc(db.collection("summary_points").document(user_id).get())
+    if summary_doc.exists and summary_doc.to_dict().get("input_hash") == input_hash:
+        return summary_doc.to_dict()["summary"]
+    return None
 
+async def _build_feedback_summary(user_id: str, on_tip=None):
+    summary, job = await run_db(summary_inputs, user_id)
+    if summary is not None:
+        return {"summary": summary}
+
+    if SUMMARY_LEASE_SECONDS > 0:
+        # Another instance is generating this summary: wait for it, or for its lease to expire
+        waited = False
+        while not await run_db(acquire_lease, user_id):
+            if not waited:
+                summary_stats["lease_waits"] += 1
+                waited = True
+            await asyncio.sleep(SUMMARY_LEASE_POLL_SECONDS)
+            summary = await run_db(stored_summary_for, user_id, job["input_hash"])
+            if summary is not None:
+                return {"summary": summary}
+        if waited:
+            # The holder may have saved and released between the last poll and our acquire
+            summary = await run_db(stored_summary_for, user_id, job["input_hash"])
+            if summary is not None:
+                await run_db(release_lease, user_id)
+                return {"summary": summary}
+
+    try:
         # Generate summary using LLM
-        llm_response = generate_feedback_summary(all_feedback)
+        if on_tip is not None:
+            llm_response = await stream_feedback_summary(job["feedback"], on_tip)
+        else:
+            llm_response = await generate_feedback_summary(job["feedback"])
         llm_response = json.loads(llm_response)
 
-        # Save summary to Firestore
-        summary_ref.document(user_id).set({
-            "summary": llm_response,
-            "timestamp": datetime.now()
-        })
+        await run_db(save_summary, user_id, llm_response, {"input_hash": job["input_hash"], "latest_feedback_id": job["latest_feedback_id"]})
+    finally:
+        if SUMMARY_LEASE_SECONDS > 0:
+            await run_db(release_lease, user_id)
+    return {"summary": llm_response}
+
+async def build_feedback_summary(user_id: str, on_tip=None):
+    """One build per user at a time in this process; concurrent callers share its result.
+
+    If this call starts the build and it needs the LLM, on_tip(key, tip) is
+    called as each tip is generated.
+    """
+    future = summary_inflight.get(user_id)
+    if future is not None:
+        summary_stats["coalesced_requests"] += 1
+    else:
+        future = asyncio.ensure_future(_build_feedback_summary(user_id, on_tip))
+        summary_inflight[user_id] = future
+        future.add_done_callback(lambda _: summary_inflight.pop(user_id, None))
+    # Shield so a disconnecting client does not cancel the build for everyone else
+    return await asyncio.shield(future)
+
+# Precomputation waits while live requests use every LLM slot
+precompute_queue = SummaryQueue(
+    build_feedback_summary,
+    is_busy=lambda: llm.inflight >= LLM_MAX_CONCURRENCY,
+    jobs_per_minute=SUMMARY_JOBS_PER_MINUTE,
+    batch_size=SUMMARY_BATCH_SIZE,
+)
+
+async def enqueue_summary(user_id: str, sections: list[str]):
+    precompute_queue.enqueue(user_id)
 
-        return {"summary": llm_response}
+@app.get("/feedback_summary/")
+async def get_feedback_summary(user_id: str):
+    precompute_queue.touch(user_id)
+    try:
+        return await build_feedback_summary(user_id)
 
+    except HTTPException:
+        # e.g. 404 for users without feedback, which the dashboard must not count as an outage
+        raise
     except GoogleAPICallError as e:
         raise HTTPException(status_code=500, detail=f"Firestore Error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating summary: {str(e)}")
 
+def sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+@app.get("/feedback_summary/stream/")
+async def stream_feedback_summary_events(user_id: str):
+    """Server-sent events: a `tip` event per tip as soon as it is generated, then the
+    full `summary` (what /feedback_summary/ returns), or an `error` event.
+
+    Stored summaries are sent at once. The summary is saved when generation
+    completes, even if the client has disconnected by then.
+    """
+    precompute_queue.touch(user_id)
+    tips = asyncio.Queue()
+    build = asyncio.ensure_future(build_feedback_summary(user_id, on_tip=lambda kind, tip: tips.put_nowait((kind, tip))))
+    # Retrieve the outcome even if the client disconnects before it is sent
+    build.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def events():
+        sent = set()
+        next_tip = None
+        try:
+            while True:
+                next_tip = asyncio.ensure_future(tips.get())
+                done, _ = await asyncio.wait({next_tip, build}, return_when=asyncio.FIRST_COMPLETED)
+                if next_tip not in done:
+                    break
+                kind, tip = next_tip.result()
+                sent.add((kind, tip))
+                yield sse_event("tip", {"kind": kind, "tip": tip})
+        finally:
+            # Also runs when the client disconnects while we wait
+            if next_tip is not None:
+                next_tip.cancel()
+
+        try:
+            result = build.result()
+        except HTTPException as e:
+            yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+        except Exception as e:
+            yield sse_event("error", {"status_code": 500, "detail": f"Error generating summary: {str(e)}"})
+            return
+
+        # Tips that were not streamed: queued just before the build finished, or a stored/shared summary
+        while not tips.empty():
+            kind, tip = tips.get_nowait()
+            sent.add((kind, tip))
+            yield sse_event("tip", {"kind": kind, "tip": tip})
+        for kind, tip in summary_tips(result):
+            if (kind, tip) not in sent:
+                yield sse_event("tip", {"kind": kind, "tip": tip})
+        yield sse_event("summary", result)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/feedback_summary/stats")
+async def get_summary_stats():
+    return {
+        **summary_stats,
+        "inflight": len(summary_inflight),
+        "queue": precompute_queue.snapshot_stats(),
+        "llm": llm.snapshot_stats(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,113 @@
+"""Background precomputation of feedback summaries.
+
+When feedback lands (a feedback_written event, published as it is rolled up)
+the user is queued, and a worker regenerates the summary ahead of the next
+request, so /feedback_summary/ normally finds a summary that already
+matches the user's latest feedback and only has to read it.
+
+Users who were active most recently are served first: the queue is ordered
+by last activity, which is updated by feedback events and by requests for
+the user's summary. The worker takes up to `batch_size` jobs at a time,
+starts no more than `jobs_per_minute` in any minute (the LLM budget for
+precomputation), and pauses while live requests are using every LLM slot.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+
+
+class SummaryQueue:
+    def __init__(
+        self,
+        build,
+        is_busy=lambda: False,
+        jobs_per_minute: float = 20.0,
+        batch_size: int = 5,
+        max_users: int = 10000,
+    ):
+        # build(user_id) is a coroutine that regenerates the summary if its inputs changed
+        self.build = build
+        self.is_busy = is_busy
+        self.batch_size = batch_size
+        self.max_users = max_users
+        # Token bucket: refills at jobs_per_minute, holds at most one batch
+        self.rate = jobs_per_minute / 60.0
+        self.tokens = float(batch_size)
+        self.refilled_at = time.monotonic()
+        self.last_active: OrderedDict[str, float] = OrderedDict()
+        self.pending: dict[str, float] = {}  # user_id -> priority of its live heap entry
+        self.heap: list = []
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.stats = {"enqueued": 0, "built": 0, "failed": 0, "batches": 0, "busy_waits": 0}
+
+    def touch(self, user_id: str):
+        """Record activity; a queued user moves up accordingly."""
+        self.last_active[user_id] = time.time()
+        self.last_active.move_to_end(user_id)
+        while len(self.last_active) > self.max_users:
+            self.last_active.popitem(last=False)
+        if user_id in self.pending:
+            self._push(user_id)
+
+    def enqueue(self, user_id: str):
+        if user_id not in self.last_active:
+            self.last_active[user_id] = time.time()
+        if user_id not in self.pending:
+            self.stats["enqueued"] += 1
+        self._push(user_id)
+        self.wakeup.set()
+
+    def _push(self, user_id: str):
+        priority = self.last_active.get(user_id, 0.0)
+        self.pending[user_id] = priority
+        # Newest activity first; superseded entries are skipped when popped
+        heapq.heappush(self.heap, (-priority, next(self.counter), user_id))
+
+    def _pop_batch(self, size: int) -> list:
+        batch = []
+        while self.heap and len(batch) < size:
+            negative_priority, _, user_id = heapq.heappop(self.heap)
+            if self.pending.get(user_id) == -negative_priority:
+                del self.pending[user_id]
+                batch.append(user_id)
+        return batch
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(float(self.batch_size), self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    async def _build(self, user_id: str):
+        try:
+            await self.build(user_id)
+            self.stats["built"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Summary precomputation for {user_id} failed: {str(e)}")
+
+    async def run(self):
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            if self.is_busy():
+                self.stats["busy_waits"] += 1
+                await asyncio.sleep(1.0)
+                continue
+
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+
+            batch = self._pop_batch(int(self.tokens))
+            self.tokens -= len(batch)
+            self.stats["batches"] += 1
+            await asyncio.gather(*(self._build(user_id) for user_id in batch))
+
+    def snapshot_stats(self) -> dict:
+        return {**self.stats, "queued": len(self.pending), "tokens": round(self.tokens, 2)}
@@ -0,0 +1,93 @@
+"""ScoreColumns must give the same answers as the per-request averaging it replaced."""
+import math
+import random
+import statistics
+from score_columns import CATEGORIES, ScoreColumns
+
+
+# The analytics services' calculate_averages() before the columnar engine, also returning its counts
+def calculate_averages(feedback_list, keys):
+    total_scores = {key: 0 for key in keys}
+    count = {key: 0 for key in keys}
+
+    for feedback in feedback_list:
+        for key in keys:
+            if key in feedback and feedback[key] is not None:
+                try:
+                    total_scores[key] += float(feedback[key])  # Convert to float for averaging
+                    count[key] += 1
+                except ValueError:
+                    pass  # Skip non-numeric values
+
+    # Compute averages
+    avg_scores = {key: (total_scores[key] / count[key]) if count[key] > 0 else None for key in keys}
+    return avg_scores, count
+
+
+KEYS = ["empathy_score", "objection_handling", "stuttering_words", "engagement", "rapport_building"]
+VALUES = [7, 3.5, "8", "6.25", None, "n/a", "", "high"]
+
+
+def mixed_feedback(seed=7, users=20):
+    rng = random.Random(seed)
+    entries = []
+    for user in range(users):
+        for _ in range(rng.randint(1, 8)):
+            entry = {"user_id": f"user-{user}"}
+            for category in CATEGORIES:
+                if rng.random() < 0.8:
+                    # Keys are missing from some documents
+                    entry[category] = {key: rng.choice(VALUES) for key in KEYS if rng.random() < 0.7}
+            entries.append(entry)
+    return entries
+
+
+def test_means_and_counts_match_calculate_averages():
+    entries = mixed_feedback()
+    columns = ScoreColumns.from_feedback(entries)
+    stats = columns.aggregate()
+    column_of = {column: index for index, column in enumerate(columns.columns)}
+
+    for user_index, user_id in enumerate(stats.users):
+        user_entries = [entry for entry in entries if entry["user_id"] == user_id]
+        for category in CATEGORIES:
+            category_maps = [entry[category] for entry in user_entries if category in entry]
+            expected, expected_counts = calculate_averages(category_maps, KEYS)
+            for key in KEYS:
+                column = column_of.get((category, key))
+                count = 0 if column is None else int(stats.counts[user_index, column])
+                mean = None if column is None or math.isnan(stats.means[user_index, column]) else stats.means[user_index, column]
+                assert count == expected_counts[key], (user_id, category, key)
+                if expected[key] is None:
+                    assert mean is None, (user_id, category, key)
+                else:
+                    assert math.isclose(mean, expected[key]), (user_id, category, key)
+
+
+def test_summary_spread_of_numeric_scores():
+    entries = mixed_feedback(seed=11)
+    stats = ScoreColumns.from_feedback(entries).aggregate()
+
+    for user_index, user_id in enumerate(stats.users):
+        summary = stats.summary(user_index)
+        for category, keys in summary.items():
+            for key, result in keys.items():
+                scores = []
+                for entry in entries:
+                    value = entry.get(category, {}).get(key) if entry["user_id"] == user_id else None
+                    try:
+                        scores.append(float(value))
+                    except (TypeError, ValueError):
+                        pass
+                if not scores:
+                    assert result["mean"] is None and result["min"] is None and result["std"] is None
+                    continue
+                assert result["count"] == len(scores)
+                assert math.isclose(result["mean"], statistics.fmean(scores))
+                assert result["min"] == min(scores) and result["max"] == max(scores)
+                assert math.isclose(result["std"], statistics.pstdev(scores), abs_tol=1e-9)
+
+
+def test_no_feedback():
+    stats = ScoreColumns.from_feedback([]).aggregate()
+    assert stats.users == [] and stats.means.shape == (0, 0)
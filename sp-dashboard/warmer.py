@@ -0,0 +1,94 @@
+"""Background cache warmer for recently active dashboard users.
+
+Users are marked active when they load their dashboard, finish a session
+(invalidation events) or log in (POST /dashboard/activity/ from the auth
+service). Every few seconds the warmer refreshes their sections that are
+missing or close to expiry, so their next dashboard load is a cache hit.
+
+Warming is deliberately cheap for live traffic: refreshes are started at a
+fixed maximum rate, at most `concurrency` run at once, and a round is
+skipped while the dashboard is busy with live upstream fetches.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class CacheWarmer:
+    def __init__(
+        self,
+        refresh,
+        sections_due,
+        is_busy=lambda: False,
+        active_window: float = 2 * 3600,
+        max_users: int = 5000,
+        interval: float = 30.0,
+        refreshes_per_second: float = 5.0,
+        concurrency: int = 4,
+    ):
+        # refresh(section, user_id) and sections_due(user_id) are coroutines
+        self.refresh = refresh
+        self.sections_due = sections_due
+        self.is_busy = is_busy
+        self.active_window = active_window
+        self.max_users = max_users
+        self.interval = interval
+        self.min_spacing = 1.0 / refreshes_per_second
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # user_id -> last activity, most recent last
+        self.active: OrderedDict[str, float] = OrderedDict()
+        self.tasks: set[asyncio.Task] = set()
+        self.stats = {"rounds": 0, "skipped_rounds": 0, "refreshes": 0, "refresh_errors": 0}
+
+    def touch(self, user_id: str):
+        self.active[user_id] = time.time()
+        self.active.move_to_end(user_id)
+        while len(self.active) > self.max_users:
+            self.active.popitem(last=False)
+
+    def _expire_inactive(self):
+        cutoff = time.time() - self.active_window
+        while self.active:
+            user_id, last_seen = next(iter(self.active.items()))
+            if last_seen >= cutoff:
+                break
+            self.active.popitem(last=False)
+
+    async def _refresh(self, section: str, user_id: str):
+        try:
+            await self.refresh(section, user_id)
+            self.stats["refreshes"] += 1
+        except Exception as e:
+            self.stats["refresh_errors"] += 1
+            print(f"Warmer refresh of {section} for {user_id} failed: {str(e)}")
+        finally:
+            self.semaphore.release()
+
+    async def warm_once(self):
+        self._expire_inactive()
+        if self.is_busy():
+            self.stats["skipped_rounds"] += 1
+            return
+        self.stats["rounds"] += 1
+
+        # Most recently active users first
+        for user_id in reversed(list(self.active)):
+            for section in await self.sections_due(user_id):
+                await self.semaphore.acquire()
+                task = asyncio.create_task(self._refresh(section, user_id))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+                await asyncio.sleep(self.min_spacing)
+                if self.is_busy():
+                    return
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.warm_once()
+            except Exception as e:
+                print(f"Warmer round failed: {str(e)}")
+
+    def snapshot_stats(self) -> dict:
+        return {**self.stats, "active_users": len(self.active), "running": len(self.tasks)}
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
@@ -12,6 +12,7 @@ import json
 from dotenv import load_dotenv
 import random
 import string
+import httpx
 load_dotenv()
 
 # Initialize Supabase
@@ -24,6 +25,9 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Dashboard endpoint told about logins so it can warm the user's dashboard
+DASHBOARD_ACTIVITY_URL = os.getenv("DASHBOARD_ACTIVITY_URL")
+
 app = FastAPI()
 
 app.add_middleware(
@@ -185,11 +189,23 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
 async def signup(user: UserCreate):
     return await create_user_in_db(user)
 
+async def notify_dashboard_activity(user_id: str):
+    if not DASHBOARD_ACTIVITY_URL:
+        return
+    try:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.post(DASHBOARD_ACTIVITY_URL, json={"user_id": user_id})
+            response.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"Error notifying dashboard of login: {str(e)}")
+
 @app.post("/token", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(background_tasks: BackgroundTasks, form_data: OAuth2PasswordRequestForm = Depends()):
     user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
+    # Runs after the response is sent, so login latency is unaffected
+    background_tasks.add_task(notify_dashboard_activity, user.id)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(data={"sub": user.email}, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer", **user.model_dump()}
@@ -11,6 +11,7 @@ from typing import Dict
 from urllib.parse import urlparse
 from dotenv import load_dotenv
 from loguru import logger
+import httpx
 from pipecat.audio.vad.silero import SileroVADAnalyzer
 from pipecat.frames.frames import EndFrame, LLMMessagesFrame
 from pipecat.pipeline.pipeline import Pipeline
@@ -38,6 +39,9 @@ supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(supabase_url, supabase_key)
 
+# Dashboard endpoint that is told when a session is saved, so it drops cached data
+dashboard_invalidate_url = os.getenv("DASHBOARD_INVALIDATE_URL")
+
 # Variable to store the start time
 start_time = None
 
@@ -56,6 +60,18 @@ async def save_in_db(room_id: str, transcript: str, prompt_type: str, user_id: s
     }
     response = supabase.table("transcription").upsert(data).execute()
     logger.info(f"Transcription saved successfully for room: {room_id}, Response: {response}")
+    await notify_dashboard(user_id, "session_saved")
+
+# Tell the dashboard its cached data for this user is out of date
+async def notify_dashboard(user_id: str, event: str):
+    if not dashboard_invalidate_url:
+        return
+    try:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.post(dashboard_invalidate_url, json={"user_id": user_id, "event": event})
+            response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.warning(f"Dashboard invalidation failed for user {user_id}: {e}")
 
 # Main execution function
 async def main(room_url: str, token: str, config_b64: str):
@@ -1,5 +1,8 @@
 from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import uuid
 import firebase_admin
 from firebase_admin import firestore, credentials
@@ -18,6 +21,20 @@ firebase_admin.initialize_app(cred)
 # Create a Firestore client to interact with Firebase Firestore database
 db = firestore.client()
 
+# The Firestore client is blocking; endpoints run its calls on a bounded pool of threads
+# (sharing the one client and its connection) so a slow query doesn't stall the event loop.
+# FIRESTORE_OFFLOAD=0 runs them inline, for before/after benchmarks.
+FIRESTORE_MAX_WORKERS = int(os.getenv("FIRESTORE_MAX_WORKERS", "32"))
+FIRESTORE_OFFLOAD = os.getenv("FIRESTORE_OFFLOAD", "1") != "0"
+db_executor = ThreadPoolExecutor(max_workers=FIRESTORE_MAX_WORKERS, thread_name_prefix="firestore")
+
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking Firestore call on the Firestore thread pool."""
+    if not FIRESTORE_OFFLOAD:
+        return func(*args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(db_executor, functools.partial(func, *args, **kwargs))
+
 # Initialize FastAPI application
 app = FastAPI()
 
@@ -72,7 +89,7 @@ async def create_user_scenario(userid: str, roleplay_type: str, difficulty_level
             )
         
         # Update the user document
-        doc_ref.update(update_data)
+        await run_db(doc_ref.update, update_data)
         
         return {
             "message": "User scenario updated successfully",
@@ -101,7 +118,7 @@ async def create_scenario(name: str, prompt: str, type: str, AI_persona: str):
     try:
         # Reference the "scenarios" collection in Firestore and create a new document
         doc_ref = db.collection(u'scenarios').document(id) 
-        doc_ref.set({
+        await run_db(doc_ref.set, {
             u'name': name,
             u'prompt': prompt,
             u'type': type,
@@ -129,7 +146,7 @@ async def get_scenario(roleplay_type: str, difficulty_level: str, userid: str):
     try:
         # 1. Fetch user's document to check previously used scenarios
         user_doc_ref = db.collection(u'users').document(userid)
-        user_doc = user_doc_ref.get()
+        user_doc = await run_db(user_doc_ref.get)
         used_scenarios = []
         if user_doc.exists:
             user_data = user_doc.to_dict()
@@ -139,7 +156,7 @@ async def get_scenario(roleplay_type: str, difficulty_level: str, userid: str):
         # 2. Query scenarios matching roleplay type
         scenarios_ref = db.collection(u'scenarios')
         roleplay_query = scenarios_ref.where("type", "==", roleplay_type)
-        docs = roleplay_query.stream()
+        docs = await run_db(lambda: list(roleplay_query.stream()))
         
         # 3. Manually filter for difficulty_level since composite filters are avoided
         all_scenarios = []
@@ -155,14 +172,14 @@ async def get_scenario(roleplay_type: str, difficulty_level: str, userid: str):
         if not available_scenarios:
             available_scenarios = all_scenarios
             # empty the used scenarios list
-            user_doc_ref.update({list_to_check: []})
+            await run_db(user_doc_ref.update, {list_to_check: []})
             
             # Retrieve current counter and increment
             current_counter = user_data.get(f"{list_to_check}_counter", 0)
             new_counter = current_counter + 1
             
             # Write updated counter
-            user_doc_ref.update({f"{list_to_check}_counter": new_counter})
+            await run_db(user_doc_ref.update, {f"{list_to_check}_counter": new_counter})
                 
         # 6. Randomly select a scenario from available ones
         if not available_scenarios:
@@ -174,7 +191,7 @@ async def get_scenario(roleplay_type: str, difficulty_level: str, userid: str):
         
         # 7. Retrieve the selected scenario's document
         doc_ref = scenarios_ref.document(selected_scenario)
-        doc = doc_ref.get()
+        doc = await run_db(doc_ref.get)
         if not doc.exists:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -214,14 +231,14 @@ async def update_scenario(scenario_id: str, name: str, prompt: str, type: str, A
     """
     try:
         doc_ref = db.collection(u'scenarios').document(scenario_id)
-        doc = doc_ref.get()
+        doc = await run_db(doc_ref.get)
         if not doc.exists:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Scenario not found"
             )
         # Update the scenario with the new values
-        doc_ref.update({
+        await run_db(doc_ref.update, {
             u'name': name,
             u'prompt': prompt,
             u'type': type,
@@ -246,14 +263,14 @@ async def delete_scenario(scenario_id: str):
     """
     try:
         doc_ref = db.collection(u'scenarios').document(scenario_id)
-        doc = doc_ref.get()
+        doc = await run_db(doc_ref.get)
         if not doc.exists:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Scenario not found"
             )
         # Delete the scenario document from Firestore
-        doc_ref.delete()
+        await run_db(doc_ref.delete)
         return {"message": "Scenario deleted successfully"}
     except HTTPException:
         raise
@@ -272,7 +289,7 @@ async def get_all_scenario_ids():
     It returns an empty message if no scenarios are found.
     """
     try:
-        docs = db.collection(u'scenarios').stream() 
+        docs = await run_db(lambda: list(db.collection(u'scenarios').stream()))
         
         # Collect all the scenario IDs
         scenario_ids = [doc.id for doc in docs]